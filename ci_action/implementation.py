@@ -1,12 +1,15 @@
 """Webhook implementation for Github"""
 
-import boto3
 import concurrent.futures
+import functools
+import hashlib
 import logging
 import os
 import random
 import shutil
+import stat
 import subprocess
+import tempfile
 import time
 
 from ci_action.library import aws_client
@@ -16,12 +19,35 @@ from ci_action.library import pr_resolve
 
 import pprint
 
-BUILD_ENVIRONMENTS = ['gcc', 'intel', 'gcc11']
+BUILD_ENVIRONMENTS = ('gcc', 'intel', 'gcc11')
 
 LOG = logging.getLogger("implementation")
 
 BUILD_CACHE_BUCKET = os.environ.get('BUILD_CACHE_BUCKET', 'jcsda-usaf-ci-build-cache')
 
+# Compressors for the bundle tarball in order of preference as
+# (executable, tar compress program, tarball extension): multithreaded zstd,
+# then parallel gzip (pigz), then plain gzip. zstd is skipped unless
+# BUNDLE_COMPRESSION is "zstd" since extracting a zstd bundle needs zstd in the
+# Batch test images and job definitions that extract with `tar -xf`; it must
+# not be enabled before both are deployed. By default pigz is used when it is
+# available. The bundle is a transient artifact (uploaded, extracted once by
+# the test job) so a low compression level is used to favor speed over
+# compression ratio.
+BUNDLE_COMPRESSORS = (
+    ('zstd', 'zstd -T0 -3', '.tar.zst'),
+    ('pigz', 'pigz -3', '.tar.gz'),
+    ('gzip', 'gzip -3', '.tar.gz'),
+)
+BUNDLE_COMPRESSION = os.environ.get('BUNDLE_COMPRESSION', 'gzip')
+
+# Test scripts and resources added to the bundle as `jedi_ci_resources`.
+CI_RESOURCES_PATH = '/app/shell'
+
+# S3 key prefix for cached clones of the bundle repository. Cached clones are
+# keyed by the commit SHA of the bundle branch so they never need invalidation.
+BUNDLE_CLONE_CACHE_PREFIX = 'ci_action_bundle_clones'
+
 
 class TimeCheckpointer:
     def __init__(self):
@@ -35,22 +61,398 @@ class TimeCheckpointer:
         return f'<time elapsed: {checkpoint_delta} seconds>'
 
 
+def _log_command(args):
+    """Log a command before it is run."""
+    # The command line is only joined when it will be logged.
+    if LOG.isEnabledFor(logging.INFO):
+        LOG.info(f"Running command: {' '.join(args)}")
+
+
 def check_output(args, **kwargs):
     """
     Wrapper around subprocess.check_output that logs the command and its output.
     """
-    LOG.info(f"Running command: {' '.join(args)}")
+    _log_command(args)
     return subprocess.check_output(args, **kwargs)
 
 
-def upload_to_aws(bucket_name, s3_client, tarball_path, s3_file):
-    """Upload file to S3 bucket"""
-    with open(tarball_path, 'rb') as f:
-        s3_client.put_object(Body=f, Bucket=bucket_name, Key=s3_file)
+def run_quiet(args, **kwargs):
+    """
+    Run a command whose output is not used, discarding stdout.
+
+    Stderr is left attached to the action log so that the error output of a
+    failing command is visible.
+    """
+    _log_command(args)
+    subprocess.run(args, check=True, stdout=subprocess.DEVNULL, **kwargs)
+
+
+@functools.lru_cache(maxsize=1)
+def get_bundle_compressor():
+    """Select the compressor used for bundle tarballs.
+
+    Returns:
+        A (compress program, tarball extension) tuple for the first enabled
+        compressor in BUNDLE_COMPRESSORS that is available on the PATH.
+    """
+    for executable, compress_program, extension in BUNDLE_COMPRESSORS:
+        if executable == 'zstd' and BUNDLE_COMPRESSION != 'zstd':
+            continue
+        if shutil.which(executable):
+            return compress_program, extension
+    raise EnvironmentError(
+        'No bundle compressor found; one of pigz or gzip must be on the PATH')
+
+
+def upload_to_aws(bucket_name, s3_client, fileobj, s3_file):
+    """Upload a readable file object to S3 bucket using a multipart upload."""
+    s3_client.upload_fileobj(
+        fileobj, bucket_name, s3_file, Config=aws_client.get_s3_transfer_config())
     s3_path = f's3://{bucket_name}/{s3_file}'
     return s3_path
 
 
+def upload_tarball_to_aws(bucket_name, s3_client, source_path, s3_file, extra_paths=None):
+    """Stream a compressed tarball of `source_path` directly to S3.
+
+    The tar output is piped straight into the S3 multipart upload so that
+    compression overlaps with the network transfer and no intermediate
+    tarball is written to local disk.
+
+    Args:
+        bucket_name: The S3 bucket to upload to.
+        s3_client: The boto3 S3 client.
+        source_path: The directory to archive.
+        s3_file: The destination S3 key.
+        extra_paths: An optional mapping of additional directories to archive
+                     to their path within `source_path` in the archive. These
+                     are added in place without copying them into `source_path`.
+    """
+    source_name = os.path.basename(source_path)
+    compress_program, _ = get_bundle_compressor()
+    tar_args = ['tar', f'--use-compress-program={compress_program}', '-cf', '-']
+    extra_members = []
+    for extra_path, archive_path in (extra_paths or {}).items():
+        extra_name = os.path.basename(extra_path)
+        # Rename the extra directory (and its contents, but not symlink
+        # targets) to its location inside the archived source directory.
+        tar_args.append(
+            f'--transform=s,^{extra_name}\\(/\\|$\\),{source_name}/{archive_path}\\1,S')
+        extra_members += ['-C', os.path.dirname(extra_path), extra_name]
+    tar_args += ['-C', os.path.dirname(source_path), source_name] + extra_members
+    _log_command(tar_args)
+    tar_process = subprocess.Popen(tar_args, stdout=subprocess.PIPE)
+    try:
+        s3_path = upload_to_aws(bucket_name, s3_client, tar_process.stdout, s3_file)
+    finally:
+        # Closing the pipe unblocks tar if the upload failed part way.
+        tar_process.stdout.close()
+        returncode = tar_process.wait()
+    if returncode != 0:
+        # The upload completes when the pipe reaches EOF even if tar failed part
+        # way, leaving a truncated tarball at the key. Delete it so that it is
+        # never found and reused by a later run.
+        s3_client.delete_object(Bucket=bucket_name, Key=s3_file)
+        raise subprocess.CalledProcessError(returncode, tar_args)
+    return s3_path
+
+
+def s3_object_exists(bucket_name, s3_client, s3_file):
+    """Check whether an object exists in S3 with a single HEAD request."""
+    import botocore.exceptions  # Loaded with the S3 client, deferred to keep startup light.
+    try:
+        s3_client.head_object(Bucket=bucket_name, Key=s3_file)
+    except botocore.exceptions.ClientError:
+        return False
+    return True
+
+
+def get_bundle_content_digest(bundle_repo_path, bundle_files, extra_paths):
+    """Hash the inputs that determine the content of a bundle tarball.
+
+    The bundle tarball is the bundle repository at its checked out commit with
+    rewritten bundle files and extra resource directories added. Hashing the
+    commit and the names, modes and contents (or link targets) of the rewritten
+    files and the resources identifies the tarball without building it.
+
+    Args:
+        bundle_repo_path: The path to the bundle repository.
+        bundle_files: Paths of files written into the bundle after checkout.
+        extra_paths: Directories added to the tarball alongside the bundle.
+
+    Returns:
+        A hex sha256 digest.
+    """
+    digest = hashlib.sha256()
+    digest.update(check_output(['git', '-C', bundle_repo_path, 'rev-parse', 'HEAD']))
+    for path in bundle_files:
+        _update_path_digest(digest, path, os.path.relpath(path, bundle_repo_path))
+    for extra_path in extra_paths:
+        for root, dirs, files in os.walk(extra_path):
+            dirs.sort()
+            # Symlinks to directories are listed in dirs but are not walked.
+            for name in sorted(dirs + files):
+                path = os.path.join(root, name)
+                _update_path_digest(digest, path, os.path.relpath(path, extra_path))
+    return digest.hexdigest()
+
+
+def _update_path_digest(digest, path, name):
+    """Add the name, mode and content (or link target) of a path to a digest.
+
+    The mode is included so that, for example, a script that loses its
+    executable bit changes the digest even though its content does not.
+    """
+    path_stat = os.lstat(path)
+    mode = path_stat.st_mode
+    digest.update(f'\0{name}\0{mode:o}\0{path_stat.st_size}\0'.encode('utf-8'))
+    if stat.S_ISLNK(mode):
+        digest.update(os.readlink(path).encode('utf-8'))
+    elif stat.S_ISREG(mode):
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+
+
+def upload_or_reuse_bundle_tarball(s3_client, bundle_repo_path, s3_file):
+    """Upload the configured bundle tarball unless it is already at `s3_file`.
+
+    The key must identify the tarball content (see get_bundle_content_digest)
+    so an existing object is a complete copy of the same bundle;
+    upload_tarball_to_aws never leaves a partial object at the key.
+
+    Returns:
+        The s3:// path of the tarball.
+    """
+    if s3_object_exists(BUILD_CACHE_BUCKET, s3_client, s3_file):
+        s3_path = f's3://{BUILD_CACHE_BUCKET}/{s3_file}'
+        LOG.info(f"Reusing bundle tarball {s3_path}")
+        return s3_path
+    LOG.info(f"Uploading bundle tarball of {bundle_repo_path} to {s3_file}")
+    return upload_tarball_to_aws(
+        BUILD_CACHE_BUCKET, s3_client, bundle_repo_path, s3_file,
+        extra_paths={CI_RESOURCES_PATH: 'jedi_ci_resources'},
+    )
+
+
+def download_tarball_from_aws(bucket_name, s3_client, s3_file, destination_path):
+    """Stream a compressed tarball from S3 and extract it into `destination_path`.
+
+    The top level directory of the archive is stripped so that tarballs
+    created by `upload_tarball_to_aws` can be extracted to any path.
+    """
+    os.makedirs(destination_path)
+    compress_program, _ = get_bundle_compressor()
+    tar_args = [
+        'tar', f'--use-compress-program={compress_program}', '-xf', '-',
+        '--strip-components=1', '-C', destination_path
+    ]
+    _log_command(tar_args)
+    tar_process = subprocess.Popen(tar_args, stdin=subprocess.PIPE)
+    try:
+        s3_client.download_fileobj(bucket_name, s3_file, tar_process.stdin)
+    finally:
+        tar_process.stdin.close()
+        returncode = tar_process.wait()
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, tar_args)
+
+
+def get_remote_branch_sha(repository, branch):
+    """Resolve the commit SHA at the head of a branch in a remote repository."""
+    branch_ref = f'refs/heads/{branch}'
+    output = check_output(['git', 'ls-remote', '--heads', repository, branch_ref])
+    for line in output.decode('utf-8').splitlines():
+        sha, ref = line.split('\t', 1)
+        if ref == branch_ref:
+            return sha
+    raise ValueError(f'Branch "{branch}" was not found in "{repository}"')
+
+
+def get_bundle_clone_cache_key(bundle_repository, sha):
+    """Get the S3 key of a cached bundle clone."""
+    repository_path = bundle_repository.split('://', 1)[-1]
+    if repository_path.endswith('.git'):
+        repository_path = repository_path[:-4]
+    _, extension = get_bundle_compressor()
+    return f'{BUNDLE_CLONE_CACHE_PREFIX}/{repository_path}/{sha}{extension}'
+
+
+def cache_bundle_clone(s3_client, snapshot_path, cache_key):
+    """Upload a snapshot of a clean bundle clone to the clone cache.
+
+    The snapshot is a private copy so it is removed once it has been uploaded.
+    A failure only costs a later run a clone, so it is logged rather than raised.
+    """
+    try:
+        upload_tarball_to_aws(BUILD_CACHE_BUCKET, s3_client, snapshot_path, cache_key)
+        LOG.info(f'Cached bundle clone "{cache_key}"')
+    except Exception as e:
+        LOG.warning(f'Failed to cache bundle clone "{cache_key}": {e}')
+    finally:
+        shutil.rmtree(os.path.dirname(snapshot_path), ignore_errors=True)
+
+
+def fetch_bundle_repo(
+        s3_client, bundle_repository, bundle_branch, bundle_repo_path, cache_executor):
+    """Populate `bundle_repo_path` from the S3 clone cache or a fresh clone.
+
+    The head of the bundle branch is resolved with a single `git ls-remote`
+    call. If a clone of that commit has been cached it is downloaded instead
+    of cloning; otherwise (or if the cached clone cannot be extracted) the
+    repository is cloned and a snapshot of the clean clone is uploaded to the
+    cache by `cache_executor` so that later runs can reuse it. The upload runs
+    in the background and does not delay rewriting the bundle.
+    """
+    sha = get_remote_branch_sha(bundle_repository, bundle_branch)
+    cache_key = get_bundle_clone_cache_key(bundle_repository, sha)
+    if s3_object_exists(BUILD_CACHE_BUCKET, s3_client, cache_key):
+        LOG.info(f'Using cached bundle clone "{cache_key}" for "{bundle_branch}"')
+        try:
+            download_tarball_from_aws(BUILD_CACHE_BUCKET, s3_client, cache_key, bundle_repo_path)
+            return
+        except Exception as e:
+            # A bad cache entry must not fail the run; clone instead and let the
+            # fresh clone replace the cache entry below.
+            LOG.warning(f'Failed to extract cached bundle clone "{cache_key}": {e}')
+            shutil.rmtree(bundle_repo_path, ignore_errors=True)
+
+    clone_bundle_repo(bundle_repository, bundle_branch, bundle_repo_path)
+    # The branch may have moved since it was resolved; cache the cloned commit.
+    cloned_sha = check_output(
+        ['git', '-C', bundle_repo_path, 'rev-parse', 'HEAD']).decode('utf-8').strip()
+    cache_key = get_bundle_clone_cache_key(bundle_repository, cloned_sha)
+    # The clone is rewritten as soon as this returns, so the cache is uploaded
+    # from a copy. The shallow bundle clone is small and a local copy is much
+    # faster than archiving and uploading it.
+    snapshot_path = os.path.join(
+        tempfile.mkdtemp(prefix='bundle-clone-'), os.path.basename(bundle_repo_path))
+    shutil.copytree(bundle_repo_path, snapshot_path, symlinks=True)
+    cache_executor.submit(cache_bundle_clone, s3_client, snapshot_path, cache_key)
+
+
+def clone_bundle_repo(bundle_repository, bundle_branch, bundle_repo_path):
+    """Clone a branch of the bundle repository into `bundle_repo_path`.
+
+    Only the working tree of the bundle is used, so a shallow single-branch
+    clone without tags is sufficient and avoids fetching the repository history.
+    """
+    LOG.info(f"Cloning \"{bundle_repository}@{bundle_branch}\"")
+    run_quiet([
+        'git', 'clone', '--depth', '1', '--single-branch', '--no-tags', '--branch', bundle_branch,
+        bundle_repository, bundle_repo_path
+    ])
+
+
+def checkout_bundle_branch(bundle_repo_path, bundle_branch):
+    """Fetch and check out a different branch in an existing bundle clone."""
+    LOG.info(f"Switching bundle repository to branch \"{bundle_branch}\"")
+    run_quiet([
+        'git', '-C', bundle_repo_path, 'fetch', '--depth', '1', '--no-tags', 'origin', bundle_branch
+    ])
+    run_quiet([
+        'git', '-C', bundle_repo_path, 'checkout', '-B', bundle_branch, 'FETCH_HEAD'
+    ])
+
+
+def write_bundle_file(path, rewrite_function, **kwargs):
+    """Write a bundle CMake file using one of the CMakeFile rewrite methods."""
+    with open(path, 'w', buffering=1024 * 1024) as f:
+        rewrite_function(file_object=f, **kwargs)
+
+
+def launch_build_environment(
+    build_environment,
+    config,
+    test_annotations,
+    batch_config_builder,
+    configured_bundle_tarball_s3_path,
+    repo_name_full,
+    debug_time,
+):
+    """Create the GitHub check runs and submit the Batch job for one environment.
+
+    Returns:
+        The ARN of the submitted AWS Batch job.
+    """
+    checkrun_id_map = github_client.create_check_runs(
+        build_environment,
+        config['repo_name'],
+        config['owner'],
+        config['trigger_commit'],
+        test_annotations.next_ci_suffix)
+    LOG.info(f'Created check runs for {build_environment}.')
+
+    # Note checkrun_id_map is dict {'unit': unit_run.id, 'integration': integration_run.id}
+    build_identity = (
+        f'{config["repo_name"]}-'
+        f'{config["pull_request_number"]}-'
+        f'{config["trigger_commit_short"]}-{build_environment}'
+    )
+
+    job = aws_client.submit_test_batch_job(
+        config=batch_config_builder.get_config(
+            build_environment + test_annotations.next_ci_suffix
+        ),
+        repo_name=config['repo_name'],
+        repo_name_full=repo_name_full,
+        commit=config['trigger_commit_short'],
+        pr=config['pull_request_number'],
+        configured_bundle_tarball=configured_bundle_tarball_s3_path,
+        debug_time_seconds=debug_time,
+        build_identity=build_identity,
+        unittest_tag=config['unittest_tag'],
+        trigger_sha=config['trigger_commit'],
+        trigger_pr=str(config['pull_request_number']),
+        integration_run_id=checkrun_id_map['integration'],
+        unit_run_id=checkrun_id_map['unit'],
+        unittest_dependencies=' '.join(config['unittest_dependencies']),
+        test_script=config['test_script'],
+    )
+    return job['jobArn']
+
+
+def launch_build_environments(build_environments, **launch_kwargs):
+    """Launch the tests for several build environments in parallel.
+
+    The environments are independent and network-bound so each is launched with
+    launch_build_environment in its own thread. Every environment is attempted
+    before a failure is raised so that one failing environment does not stop
+    the others from launching.
+
+    Args:
+        build_environments: The build environments to launch.
+        launch_kwargs: The remaining launch_build_environment arguments.
+
+    Raises:
+        RuntimeError: if any environment failed to launch.
+    """
+    launch_failures = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(build_environments)) as executor:
+        launch_futures = {
+            executor.submit(
+                launch_build_environment, build_environment=build_environment, **launch_kwargs
+            ): build_environment
+            for build_environment in build_environments
+        }
+        for future in concurrent.futures.as_completed(launch_futures):
+            build_environment = launch_futures[future]
+            try:
+                job_arn = future.result()
+            except Exception as e:
+                LOG.error(f'Error launching tests for build environment {build_environment}: {e}')
+                launch_failures.append((build_environment, e))
+                continue
+            LOG.info(
+                f'Submitted Batch Job for build environment '
+                f'{build_environment}: "{job_arn}".'
+            )
+    if launch_failures:
+        failed_environments = ', '.join(environment for environment, _ in launch_failures)
+        raise RuntimeError(
+            f'Failed to launch tests for build environments: {failed_environments}'
+        ) from launch_failures[0][1]
+
+
 def prepare_and_launch_ci_test(
     infra_config,
     config,
@@ -83,46 +485,103 @@ def prepare_and_launch_ci_test(
 
     timer = TimeCheckpointer()  # Timer for logging.
 
-    # Fetch config from the pull request data
-    repo_uri = f'https://github.com/{config["owner"]}/{config["repo_name"]}.git'
-    test_annotations = pr_resolve.read_test_annotations(
-        repo_uri=repo_uri,
-        pr_number=config['pull_request_number'],
-        pr_payload=config['pr_payload'],
-        testmode=config['self_test'],
-    )
-    LOG.info('test_annotations:')
-    annotations_pretty = pprint.pformat(test_annotations)
-    LOG.info(f'{timer.checkpoint()}\n{annotations_pretty}')
-
-    # Check draft PR run status.
-    if config.get('pr_payload', {}).get('draft') and not test_annotations.run_on_draft:
-        LOG.info('\n\nTests are not launched for draft PRs by default.\n'
-                 'To enable testing on draft PRs, add the following annotation to the PR:\n'
-                 '```\n'
-                 'run-ci-on-draft = true\n'
-                 '```\n')
-        return non_blocking_errors
-
-    bundle_branch = config['bundle_branch']  # This is the default branch to use for the bundle.
-    if test_annotations.jedi_bundle_branch:
-        bundle_branch = test_annotations.jedi_bundle_branch  # Override based on PR annotations.
-
-    # git clone the bundle repository into `bundle_repo_path`
-    if not os.path.exists(bundle_repo_path):
-        LOG.info(f"Cloning \"{config['bundle_repository']}@{bundle_branch}\"")
-        check_output([
-            'git', 'clone', '--branch', bundle_branch,
-            config['bundle_repository'], bundle_repo_path
-        ])
-
-    repo_to_commit_hash = pr_resolve.gather_build_group_hashes(
-        test_annotations.build_group_map
-    )
-    repo_to_commit_hash_pretty = pprint.pformat(repo_to_commit_hash)
-    LOG.info(
-        f'{timer.checkpoint()}\nrepo_to_commit_hash:\n{repo_to_commit_hash_pretty}'
-    )
+    s3_client = aws_client.get_s3_client()
+
+    # The bundle clone does not depend on the pull request annotations so it is
+    # started in the background with the default bundle branch while the
+    # annotations and build group hashes are fetched from GitHub. Draft PRs are
+    # usually not tested, so their clone is only started once the annotations
+    # show that the draft should be tested.
+    # A bundle directory that already exists (e.g. during local development)
+    # may have changes beyond its HEAD commit.
+    bundle_is_fresh = not os.path.exists(bundle_repo_path)
+    is_draft = config.get('pr_payload', {}).get('draft')
+    # A fresh clone is added to the S3 clone cache in the background. The upload
+    # is joined once the tests are launched (or, on failure, at interpreter exit).
+    cache_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as clone_executor:
+        clone_future = None
+
+        def start_bundle_clone():
+            return clone_executor.submit(
+                fetch_bundle_repo,
+                s3_client=s3_client,
+                bundle_repository=config['bundle_repository'],
+                bundle_branch=config['bundle_branch'],
+                bundle_repo_path=bundle_repo_path,
+                cache_executor=cache_executor,
+            )
+
+        if bundle_is_fresh and not is_draft:
+            clone_future = start_bundle_clone()
+
+        # Fetch config from the pull request data
+        repo_uri = f'https://github.com/{config["owner"]}/{config["repo_name"]}.git'
+        test_annotations = pr_resolve.read_test_annotations(
+            repo_uri=repo_uri,
+            pr_number=config['pull_request_number'],
+            pr_payload=config['pr_payload'],
+            testmode=config['self_test'],
+        )
+        if LOG.isEnabledFor(logging.INFO):
+            LOG.info(f'{timer.checkpoint()}\n'
+                     f'test_annotations:\n{pprint.pformat(test_annotations)}')
+
+        # Check draft PR run status.
+        if is_draft and not test_annotations.run_on_draft:
+            LOG.info('\n\nTests are not launched for draft PRs by default.\n'
+                     'To enable testing on draft PRs, add the following annotation to the PR:\n'
+                     '```\n'
+                     'run-ci-on-draft = true\n'
+                     '```\n')
+            return non_blocking_errors
+        if bundle_is_fresh and is_draft:
+            clone_future = start_bundle_clone()
+
+        # Use a thread pool to cancel prior unfinished jobs and their associated
+        # check runs. The cancellations only need to finish before the new jobs
+        # are submitted so they run in the background while the bundle is
+        # prepared and uploaded. The pool is shut down without waiting; the
+        # submitted operations still run to completion and are joined below.
+        # Each future is keyed to a description of what it cancels.
+        cancel_executor = concurrent.futures.ThreadPoolExecutor(max_workers=2)
+        cancel_futures = {
+            # Cancel prior unfinished AWS Batch jobs for the PR.
+            cancel_executor.submit(
+                aws_client.cancel_prior_batch_jobs,
+                job_queue=infra_config['batch_queue'],
+                repo_name=config['repo_name'],
+                pr=config["pull_request_number"],
+            ): 'prior batch jobs',
+            # Cancel unfinished check runs for the PR.
+            cancel_executor.submit(
+                github_client.cancel_prior_unfinished_check_runs,
+                repo=config['repo_name'],
+                owner=config['owner'],
+                pr_number=config["pull_request_number"],
+            ): 'prior check runs',
+        }
+        cancel_executor.shutdown(wait=False)
+
+        # The triggering PR is already described by the event payload so it
+        # does not need to be fetched again.
+        trigger_repo_key = f'{config["owner"].lower()}/{config["repo_name"].lower()}'
+        repo_to_commit_hash = pr_resolve.gather_build_group_hashes(
+            test_annotations.build_group_map,
+            pr_payloads={trigger_repo_key: config['pr_payload']},
+        )
+        if LOG.isEnabledFor(logging.INFO):
+            LOG.info(f'{timer.checkpoint()}\n'
+                     f'repo_to_commit_hash:\n{pprint.pformat(repo_to_commit_hash)}')
+
+        # Wait for the bundle clone. If the PR annotations override the default
+        # bundle branch, switch the fresh clone over to the requested branch.
+        if clone_future:
+            clone_future.result()
+            bundle_branch = test_annotations.jedi_bundle_branch
+            if bundle_branch and bundle_branch != config['bundle_branch']:
+                checkout_bundle_branch(bundle_repo_path, bundle_branch)
+        LOG.info(f'{timer.checkpoint()}\nBundle repository is ready at {bundle_repo_path}')
 
     # Import the bundle file
     bundle_file = os.path.join(bundle_repo_path, 'CMakeLists.txt')
@@ -133,94 +592,91 @@ def prepare_and_launch_ci_test(
     bundle_integration = os.path.join(
         bundle_repo_path, 'CMakeLists.txt.integration'
     )
-    with open(bundle_file, 'r') as f:
-        bundle = cmake_rewrite.CMakeFile(f.read())
+    with open(bundle_file, 'r', buffering=1024 * 1024) as f:
+        bundle = cmake_rewrite.CMakeFile.from_stream(f)
 
-    # Move the original bundle file to the original file.
-    shutil.move(bundle_file, bundle_original)
+    # Move the original bundle file to the original file. The file has been
+    # fully read and closed and both paths are in the same directory, so this
+    # is a plain rename.
+    os.replace(bundle_file, bundle_original)
 
-    # Rewrite the bundle cmake file twice
-    # First, rewrite the unit test bundle file with the build group commit hashes
-    with open(bundle_file_unittest, 'w') as f:
+    # Rewrite the bundle cmake file twice. The rewrites only read the parsed
+    # bundle so both files are written in parallel.
+    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+        # First, rewrite the unit test bundle file with the build group commit hashes
         enabled_bundles = set(config['unittest_dependencies'] + [config['target_project_name']])
-        bundle.rewrite_build_group_whitelist(
-            file_object=f,
+        unittest_future = executor.submit(
+            write_bundle_file,
+            bundle_file_unittest,
+            bundle.rewrite_build_group_whitelist,
             enabled_bundles=enabled_bundles,
             build_group_commit_map=repo_to_commit_hash,
         )
 
-    # Create an integration test file.
-    with open(bundle_integration, 'w') as f:
-        bundle.rewrite_build_group_blacklist(
-            file_object=f,
+        # Create an integration test file.
+        integration_future = executor.submit(
+            write_bundle_file,
+            bundle_integration,
+            bundle.rewrite_build_group_blacklist,
             disabled_bundles=set(),
             build_group_commit_map=repo_to_commit_hash,
         )
+        unittest_future.result()
+        integration_future.result()
     LOG.info(f'{timer.checkpoint()}\n Rewrote bundle for build groups.')
 
-    # Add resources to the bundle by copying all files in /app/shell to jedi_ci_resources
-    shutil.copytree(
-        '/app/shell', os.path.join(bundle_repo_path, 'jedi_ci_resources')
-    )
-
-    # Create a tarball  the new bundle (with test resources).
-    LOG.info(f"Creating bundle.tar.gz from {bundle_repo_path}")
-    bundle_tarball = "bundle.tar.gz"
-    check_output([
-        'tar', '-czf', bundle_tarball, '-C', os.path.dirname(bundle_repo_path),
-        os.path.basename(bundle_repo_path)
-    ])
-    LOG.info(f"{timer.checkpoint()}\nCreated bundle tarball at {bundle_tarball}")
-
-    # Upload the bundle to S3.
-    s3_file = (
+    # Create a tarball of the new bundle and stream it to S3. The test resources
+    # in /app/shell are added to the archive as jedi_ci_resources within the
+    # bundle rather than being copied into the bundle first. Compression is
+    # delegated to a multithreaded compressor (when one is available) so that
+    # it is spread across all cores.
+    #
+    # For a freshly fetched bundle the key includes a digest of the bundle
+    # content so that a rerun whose bundle is unchanged reuses the tarball
+    # uploaded by the earlier run. The digest only covers the HEAD commit of
+    # the bundle repository, so a pre-existing bundle directory (which may have
+    # local changes) is always uploaded under a key without a digest.
+    _, tarball_extension = get_bundle_compressor()
+    s3_prefix = (
         f'ci_action_bundles/{config["repository"]}/'
-        f'{config["pull_request_number"]}-'
-        f'{config["trigger_commit"]}-bundle.tar.gz'
-    )
-    s3_client = boto3.client('s3')
-    configured_bundle_tarball_s3_path = upload_to_aws(
-        BUILD_CACHE_BUCKET, s3_client, bundle_tarball, s3_file
+        f'{config["pull_request_number"]}-{config["trigger_commit"]}'
     )
+    if bundle_is_fresh:
+        bundle_digest = get_bundle_content_digest(
+            bundle_repo_path,
+            bundle_files=[bundle_file_unittest, bundle_integration],
+            extra_paths=[CI_RESOURCES_PATH],
+        )
+        s3_file = f'{s3_prefix}-{bundle_digest[:16]}-bundle{tarball_extension}'
+        configured_bundle_tarball_s3_path = upload_or_reuse_bundle_tarball(
+            s3_client, bundle_repo_path, s3_file)
+    else:
+        s3_file = f'{s3_prefix}-bundle{tarball_extension}'
+        LOG.info(f"Uploading bundle tarball of {bundle_repo_path} to {s3_file}")
+        configured_bundle_tarball_s3_path = upload_tarball_to_aws(
+            BUILD_CACHE_BUCKET, s3_client, bundle_repo_path, s3_file,
+            extra_paths={CI_RESOURCES_PATH: 'jedi_ci_resources'},
+        )
+    LOG.info(f"{timer.checkpoint()}\nBundle tarball is {configured_bundle_tarball_s3_path}")
 
     # Select the build environments to test.
     test_select = test_annotations.test_select
     if test_select == 'random':
-        chosen_build_environments = [random.choice(BUILD_ENVIRONMENTS)]
+        # Seed from the commit so that re-runs of a commit pick the same environment.
+        chosen_build_environments = [
+            random.Random(config['trigger_commit']).choice(BUILD_ENVIRONMENTS)
+        ]
     elif test_select == 'all':
-        chosen_build_environments = [e for e in BUILD_ENVIRONMENTS]
+        chosen_build_environments = list(BUILD_ENVIRONMENTS)
     else:
         chosen_build_environments = [test_select]
 
-    # Use a thread pool to cancel prior unfinished jobs and their associated check runs.
-    # This process is done in parallel to save time on slow network-bound operations.
-    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
-
-        # Submit operation: cancel prior unfinished AWS Batch jobs for the PR.
-        cxl_batch_future = executor.submit(
-            aws_client.cancel_prior_batch_jobs,
-            job_queue=infra_config['batch_queue'],
-            repo_name=config['repo_name'],
-            pr=config["pull_request_number"],
-        )
-
-        # Submit operation: cancel unfinished check runs for the PR.
-        cxl_checkrun_future = executor.submit(
-            github_client.cancel_prior_unfinished_check_runs,
-            repo=config['repo_name'],
-            owner=config['owner'],
-            pr_number=config["pull_request_number"],
-        )
-
-        # Wait for the cancel operations to complete.
-        for future in concurrent.futures.as_completed([cxl_batch_future, cxl_checkrun_future]):
-            try:
-                future.result()
-            except Exception as e:
-                if future is cxl_batch_future:
-                    non_blocking_errors.append(f"Error cancelling prior batch jobs: {e}")
-                else:
-                    non_blocking_errors.append(f"Error cancelling prior check runs: {e}")
+    # Wait for the cancel operations to complete before submitting new jobs.
+    for future in concurrent.futures.as_completed(cancel_futures):
+        try:
+            future.result()
+        except Exception as e:
+            non_blocking_errors.append(f"Error cancelling {cancel_futures[future]}: {e}")
 
     # This is a constructor for the configuration needed to submit AWS Batch jobs.
     # This constructor reads configuration from the environment and must be
@@ -233,49 +689,23 @@ def prepare_and_launch_ci_test(
         timeout=60 * 240
     )
 
-    # write the test github check runs to the PR.
-    for build_environment in chosen_build_environments:
-        checkrun_id_map = github_client.create_check_runs(
-            build_environment,
-            config['repo_name'],
-            config['owner'],
-            config['trigger_commit'],
-            test_annotations.next_ci_suffix)
-        LOG.info(f'{timer.checkpoint()}\nCreated check runs for {build_environment}.')
-
-        # Note checkrun_id_map is dict {'unit': unit_run.id, 'integration': integration_run.id}
-        debug_time = 60 * 30 if test_annotations.debug_mode else 0
-        build_identity = (
-            f'{config["repo_name"]}-'
-            f'{config["pull_request_number"]}-'
-            f'{config["trigger_commit_short"]}-{build_environment}'
-        )
-        repo_name_full = (
-            f'{config["owner"]}/{config["repo_name"]}'
-        )
+    # Values shared by every build environment's job submission.
+    repo_name_full = f'{config["owner"]}/{config["repo_name"]}'
+    debug_time = 60 * 30 if test_annotations.debug_mode else 0
+
+    # Create the check runs and submit the test job for each build environment.
+    launch_build_environments(
+        chosen_build_environments,
+        config=config,
+        test_annotations=test_annotations,
+        batch_config_builder=batch_config_builder,
+        configured_bundle_tarball_s3_path=configured_bundle_tarball_s3_path,
+        repo_name_full=repo_name_full,
+        debug_time=debug_time,
+    )
+    LOG.info(f'{timer.checkpoint()}\nLaunched tests for {len(chosen_build_environments)} '
+             'build environments.')
 
-        job = aws_client.submit_test_batch_job(
-            config=batch_config_builder.get_config(
-                build_environment + test_annotations.next_ci_suffix
-            ),
-            repo_name=config['repo_name'],
-            repo_name_full=repo_name_full,
-            commit=config['trigger_commit_short'],
-            pr=config['pull_request_number'],
-            configured_bundle_tarball=configured_bundle_tarball_s3_path,
-            debug_time_seconds=debug_time,
-            build_identity=build_identity,
-            unittest_tag=config['unittest_tag'],
-            trigger_sha=config['trigger_commit'],
-            trigger_pr=str(config['pull_request_number']),
-            integration_run_id=checkrun_id_map['integration'],
-            unit_run_id=checkrun_id_map['unit'],
-            unittest_dependencies=' '.join(config['unittest_dependencies']),
-            test_script=config['test_script'],
-        )
-        job_arn = job['jobArn']
-        LOG.info(
-            f'{timer.checkpoint()}\nSubmitted Batch Job for build environment '
-            f'{build_environment}: "{job_arn}".'
-        )
+    cache_executor.shutdown(wait=True)
+    LOG.info(f'{timer.checkpoint()}\nBundle clone cache is up to date.')
     return non_blocking_errors
@@ -1,19 +1,100 @@
 """Wrappers for AWS functions where direct API access isn't desired.
 
+boto3 is imported inside the client getters rather than at module scope. It
+pulls in a large tree of modules and is only needed once a client is used, so
+deferring it keeps entrypoint paths such as `--noop` fast.
 """
 
-import boto3
+import concurrent.futures
 import functools
 import logging
-import re
+import threading
 
 LOG = logging.getLogger("aws_client")
 
+# Client creation from a boto3 session is not thread-safe and clients are
+# requested from worker threads, so creation and caching are serialized.
+_client_lock = threading.Lock()
+_clients = {}
+
 
 @functools.lru_cache(maxsize=1)
+def _get_session():
+    """Lazily create the boto3 session shared by all clients."""
+    import boto3
+    return boto3.session.Session()
+
+
+def get_client(service_name):
+    """Lazily initialize and cache a client for an AWS service.
+
+    All clients come from one session so the service models and credentials
+    are loaded once. Adaptive retries back off on throttling, the larger
+    connection pool supports concurrent S3 part uploads and Batch calls, and
+    TCP keepalive stops idle pooled connections from being dropped.
+    """
+    with _client_lock:
+        client = _clients.get(service_name)
+        if client is None:
+            import botocore.config
+            config = botocore.config.Config(
+                max_pool_connections=32,
+                retries={'mode': 'adaptive', 'max_attempts': 6},
+                tcp_keepalive=True,
+            )
+            client = _get_session().client(service_name=service_name, config=config)
+            _clients[service_name] = client
+        return client
+
+
 def get_batch_client():
-    """Lazily initialize and cache the GitHub client manager from environment."""
-    return boto3.session.Session().client(service_name='batch')
+    """Get the cached AWS Batch client."""
+    return get_client('batch')
+
+
+def get_s3_client():
+    """Get the cached S3 client."""
+    return get_client('s3')
+
+
+@functools.lru_cache(maxsize=1)
+def get_s3_transfer_config():
+    """Multipart transfer settings used when streaming files to S3.
+
+    Parts are uploaded concurrently while the producer (e.g. tar) continues to
+    write output. Streams are read and written in 1 MiB blocks rather than the
+    256 KiB default to cut per-chunk overhead.
+    """
+    import boto3.s3.transfer
+    return boto3.s3.transfer.TransferConfig(
+        multipart_threshold=8 * 1024 * 1024,
+        multipart_chunksize=16 * 1024 * 1024,
+        max_concurrency=10,
+        io_chunksize=1024 * 1024,
+        use_threads=True,
+    )
+
+
+@functools.lru_cache(maxsize=1)
+def get_latest_job_definition_arns():
+    """Get the arn of the most recent active revision of every job definition.
+
+    All active job definitions are listed with a single paginated query
+    rather than one query per job definition name.
+
+    Returns:
+        A dict mapping job definition names to the arn of their latest
+        active revision.
+    """
+    paginator = get_batch_client().get_paginator('describe_job_definitions')
+    latest = {}
+    for page in paginator.paginate(status='ACTIVE'):
+        for job_definition in page['jobDefinitions']:
+            name = job_definition['jobDefinitionName']
+            revision = job_definition['revision']
+            if name not in latest or revision > latest[name][0]:
+                latest[name] = (revision, job_definition['jobDefinitionArn'])
+    return {name: arn for name, (_, arn) in latest.items()}
 
 
 class BatchSubmitConfig(object):
@@ -26,6 +107,11 @@ class BatchSubmitConfig(object):
         self.build_environment = build_environment
 
 
+# Build environments that have a Batch job definition, including the "-next"
+# variants used when a PR opts into the next CI environment.
+_JOB_ENVIRONMENTS = ('gcc11', 'gcc', 'intel', 'gcc11-next', 'gcc-next', 'intel-next')
+
+
 class BatchSubmitConfigBuilder(object):
     """Collect batch job config values from the environment.
 
@@ -35,14 +121,9 @@ class BatchSubmitConfigBuilder(object):
 
     def __init__(self, job_name_map, job_queue, timeout):
         """Init from environment."""
-
         self._job_def_map = {
-            'gcc11': self.get_latest_job_arn(job_name_map, 'gcc11'),
-            'gcc': self.get_latest_job_arn(job_name_map, 'gcc'),
-            'intel': self.get_latest_job_arn(job_name_map, 'intel'),
-            'gcc11-next': self.get_latest_job_arn(job_name_map, 'gcc11-next'),
-            'gcc-next': self.get_latest_job_arn(job_name_map, 'gcc-next'),
-            'intel-next': self.get_latest_job_arn(job_name_map, 'intel-next')
+            job_environment: self.get_latest_job_arn(job_name_map, job_environment)
+            for job_environment in _JOB_ENVIRONMENTS
         }
         self._job_queue = job_queue
         self._timeout = timeout
@@ -59,16 +140,12 @@ class BatchSubmitConfigBuilder(object):
 
     def get_latest_job_arn(self, job_name_map, job_environment):
         """Get the job arn for a given environment."""
-        client = get_batch_client()
         batch_job_name = job_name_map[job_environment]
-        response = client.describe_job_definitions(
-            jobDefinitionName=batch_job_name,
-            status='ACTIVE',
-        )
-        # Get the most recent active job.
-        job_definitions = sorted(response['jobDefinitions'],
-                                 key=lambda x: x['revision'], reverse=True)
-        return job_definitions[0]['jobDefinitionArn']
+        latest_job_arns = get_latest_job_definition_arns()
+        if batch_job_name not in latest_job_arns:
+            raise EnvironmentError(
+                f'No active job definition "{batch_job_name}" for "{job_environment}"')
+        return latest_job_arns[batch_job_name]
 
     def get_config(self, build_environment):
         """Get a BatchSubmitConfig for a named environment."""
@@ -82,6 +159,21 @@ class BatchSubmitConfigBuilder(object):
             build_environment=build_environment)
 
 
+# Number of jobs requested per list_jobs page when looking for prior jobs.
+LIST_JOBS_PAGE_SIZE = 100
+
+# Upper bound on concurrent terminate_job/cancel_job requests.
+MAX_CANCEL_WORKERS = 16
+
+
+def get_job_name_prefix(repo_name, pr):
+    """Get the prefix shared by the names of all test jobs for a pull request.
+
+    Job names are `jedi-ci-<repo>-<pr>-<commit>-<build environment>`.
+    """
+    return f'jedi-ci-{repo_name}-{pr}-'
+
+
 def cancel_prior_batch_jobs(job_queue: str, repo_name: str, pr: int):
     """List currently running jedi-ci jobs for the PR and cancel.
 
@@ -93,17 +185,19 @@ def cancel_prior_batch_jobs(job_queue: str, repo_name: str, pr: int):
     client = get_batch_client()
     jobs_to_cancel = []
 
-    # Compile regex to match jobs from the current PR.
-    regex = re.compile(f'jedi-ci-{repo_name}-{pr}-.*')
+    job_name_prefix = get_job_name_prefix(repo_name, pr)
 
     pending_jobs_statuses = ['SUBMITTED', 'PENDING', 'RUNNABLE', 'STARTING', 'RUNNING']
 
     # Use list_jobs with a filter to find jobs from our current repo and pull request.
+    # The Batch API ignores the job status when a filter is given (and has no
+    # status filter), so jobs of every status are listed and filtered below.
+    # Large pages keep the number of round trips low for PRs with a long history.
     list_jobs_paginator = client.get_paginator('list_jobs')
     response_paginator = list_jobs_paginator.paginate(
             jobQueue=job_queue,
-            filters=[{'name': 'JOB_NAME', 'values': [f'jedi-ci-{repo_name}-{pr}-*']}],
-            maxResults=20,
+            filters=[{'name': 'JOB_NAME', 'values': [f'{job_name_prefix}*']}],
+            PaginationConfig={'PageSize': LIST_JOBS_PAGE_SIZE},
     )
 
     for response in response_paginator:
@@ -115,9 +209,9 @@ def cancel_prior_batch_jobs(job_queue: str, repo_name: str, pr: int):
             if job_status not in pending_jobs_statuses:
                 continue
 
-            # Regex to extract commit, and build environment
-            match = regex.search(job_name)
-            if not match:
+            # The server-side name filter is case-insensitive; only cancel
+            # jobs whose name matches exactly.
+            if not job_name.startswith(job_name_prefix):
                 continue
 
             # Cancel any running or pending jobs for the pull request.
@@ -128,33 +222,56 @@ def cancel_prior_batch_jobs(job_queue: str, repo_name: str, pr: int):
                 'reason': "Preempted by new test run"
             })
 
-    # Cancel the identified jobs. A failed cancellation will be caught to ensure that
-    # the new job is allowed to run (status changes may cause jobs to be uncancellable).
+    # Cancel the identified jobs. Each cancellation is an independent API round
+    # trip so they are issued concurrently. A failed cancellation is caught so
+    # that the remaining jobs are still cancelled (status changes may cause jobs
+    # to be uncancellable); failures are reported once all attempts finish.
     cancelled_jobs = []
-    for job_info in jobs_to_cancel:
-        if job_info['jobStatus'] in ['STARTING', 'RUNNING']:
-            LOG.info(f"Terminating job {job_info['jobName']} (ID: {job_info['jobId']})")
-            # Use terminate_job for running jobs
-            client.terminate_job(
-                jobId=job_info['jobId'],
-                reason=job_info['reason']
-            )
-            print(f"Terminated job {job_info['jobName']} (ID: {job_info['jobId']})")
-        else:
-            # Use cancel_job for pending jobs
-            LOG.info(f"Cancelling job {job_info['jobName']} (ID: {job_info['jobId']})")
-            client.cancel_job(
-                jobId=job_info['jobId'],
-                reason=job_info['reason']
-            )
-            print(f"Cancelled job {job_info['jobName']} (ID: {job_info['jobId']})")
-
-        cancelled_jobs.append(job_info)
+    failed_jobs = []
+    if jobs_to_cancel:
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=min(len(jobs_to_cancel), MAX_CANCEL_WORKERS)) as executor:
+            cancel_futures = {
+                executor.submit(_stop_batch_job, client, job_info): job_info
+                for job_info in jobs_to_cancel
+            }
+            for future in concurrent.futures.as_completed(cancel_futures):
+                job_info = cancel_futures[future]
+                try:
+                    future.result()
+                except Exception as e:
+                    LOG.warning(f"Failed to stop job {job_info['jobName']} "
+                                f"(ID: {job_info['jobId']}): {e}")
+                    failed_jobs.append(f"{job_info['jobName']}: {e}")
+                    continue
+                cancelled_jobs.append(job_info)
 
     LOG.info(f'Cancelled {len(cancelled_jobs)} jobs')
+    if failed_jobs:
+        raise RuntimeError(f'Failed to stop {len(failed_jobs)} jobs: {"; ".join(failed_jobs)}')
     return cancelled_jobs
 
 
+def _stop_batch_job(client, job_info):
+    """Terminate a running job or cancel a pending one."""
+    if job_info['jobStatus'] in ['STARTING', 'RUNNING']:
+        LOG.info(f"Terminating job {job_info['jobName']} (ID: {job_info['jobId']})")
+        # Use terminate_job for running jobs
+        client.terminate_job(
+            jobId=job_info['jobId'],
+            reason=job_info['reason']
+        )
+        print(f"Terminated job {job_info['jobName']} (ID: {job_info['jobId']})")
+    else:
+        # Use cancel_job for pending jobs
+        LOG.info(f"Cancelling job {job_info['jobName']} (ID: {job_info['jobId']})")
+        client.cancel_job(
+            jobId=job_info['jobId'],
+            reason=job_info['reason']
+        )
+        print(f"Cancelled job {job_info['jobName']} (ID: {job_info['jobId']})")
+
+
 def submit_test_batch_job(
         config: BatchSubmitConfig,
         repo_name: str,
@@ -173,7 +290,21 @@ def submit_test_batch_job(
         test_script: str,
 ):
     """Submit a CI batch job with updated environment variables."""
-    job_name = f'jedi-ci-{repo_name}-{pr}-{commit}-{config.build_environment}'
+    job_name = f'{get_job_name_prefix(repo_name, pr)}{commit}-{config.build_environment}'
+    environment = {
+        'TRIGGER_REPO': repo_name,
+        'TRIGGER_REPO_FULL': repo_name_full,
+        'BUILD_IDENTITY': build_identity,
+        'DEBUG_TIME_SECONDS': debug_time_seconds,
+        'CONFIGURED_BUNDLE_TARBALL_S3': configured_bundle_tarball,
+        'UNITTEST_TAG': unittest_tag,
+        'TRIGGER_SHA': trigger_sha,
+        'TRIGGER_PR': trigger_pr,
+        'INTEGRATION_RUN_ID': integration_run_id,
+        'UNIT_RUN_ID': unit_run_id,
+        'UNIT_DEPENDENCIES': unittest_dependencies,
+        'TEST_SCRIPT': test_script,
+    }
     return get_batch_client().submit_job(
         jobName=job_name,
         jobQueue=config.job_queue,
@@ -183,54 +314,8 @@ def submit_test_batch_job(
         },
         containerOverrides={
             'environment': [
-                {
-                    'name': 'TRIGGER_REPO',
-                    'value': repo_name,
-                },
-                {
-                    'name': 'TRIGGER_REPO_FULL',
-                    'value': repo_name_full,
-                },
-                {
-                    'name': 'BUILD_IDENTITY',
-                    'value': build_identity
-                },
-                {
-                    'name': 'DEBUG_TIME_SECONDS',
-                    'value': f'{debug_time_seconds}',
-                },
-                {
-                    'name': 'CONFIGURED_BUNDLE_TARBALL_S3',
-                    'value': configured_bundle_tarball,
-                },
-                {
-                    'name': 'UNITTEST_TAG',
-                    'value': unittest_tag,
-                },
-                {
-                    'name': 'TRIGGER_SHA',
-                    'value': trigger_sha,
-                },
-                {
-                    'name': 'TRIGGER_PR',
-                    'value': str(trigger_pr),
-                },
-                {
-                    'name': 'INTEGRATION_RUN_ID',
-                    'value': str(integration_run_id),
-                },
-                {
-                    'name': 'UNIT_RUN_ID',
-                    'value': str(unit_run_id),
-                },
-                {
-                    'name': 'UNIT_DEPENDENCIES',
-                    'value': unittest_dependencies,
-                },
-                {
-                    'name': 'TEST_SCRIPT',
-                    'value': test_script,
-                },
+                {'name': name, 'value': str(value)}
+                for name, value in environment.items()
             ],
         },
     )
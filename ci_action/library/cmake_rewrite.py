@@ -19,9 +19,10 @@ JEDI software this tool does not allow STASH to be used. All other
 syntax is supported and GitHub repositories can be rewritten using the
 CMakeFile class.
 """
-from dataclasses import dataclass
-from collections.abc import Container
+from dataclasses import dataclass, field
+from collections.abc import Container, Iterable
 from typing import Optional, Dict, Any
+import functools
 import re
 
 from ci_action.library import github_client
@@ -35,22 +36,32 @@ class BundleLinePart:
     # The value of the component if it is not an attribute.
     value: str = None
     quote_char: str = str()  # Defaults to empty string
+    # The rendered component; parts are not modified after construction.
+    _str: str = field(init=False, repr=False, compare=False)
 
-    def __str__(self):
+    def __post_init__(self):
         if self.is_attribute:
-            return f"{self.name}"
+            self._str = f"{self.name}"
         else:
-            return f"{self.name} {self.quote_char}{self.value}{self.quote_char}"
+            self._str = f"{self.name} {self.quote_char}{self.value}{self.quote_char}"
+
+    def __str__(self):
+        return self._str
 
 
 class BundleLine:
 
     _project_re = re.compile(r"^\s*ecbuild_bundle\(\s*PROJECT\s+([a-zA-Z0-9._-]*)\s+")
-    _git_re = re.compile(r".*GIT\s+[\"']([a-zA-Z0-9/:._-]+)[\"']\s")
-    _source_re = re.compile(r".*SOURCE\s+([a-zA-Z0-9/:._-]+)\s")
-    _branch_or_tag_re = re.compile(r".*(BRANCH|TAG)\s+([a-zA-Z0-9._-]+)\s")
-    _remote_rule_re = re.compile(r".*(UPDATE|NOREMOTE)\s")
-    _manual_and_recursive_re = re.compile(r".*(MANUAL|RECURSIVE)\s")
+    # The arguments following the project name are read in a single scan. Each
+    # alternative is a keyword with its value (if any) and must be followed by
+    # whitespace; when a keyword repeats the last occurrence wins.
+    _token_re = re.compile(
+        r"(?:GIT\s+[\"'](?P<git>[a-zA-Z0-9/:._-]+)[\"']"
+        r"|SOURCE\s+(?P<source>[a-zA-Z0-9/:._-]+)"
+        r"|(?P<version_ref_type>BRANCH|TAG)\s+(?P<version_ref>[a-zA-Z0-9._-]+)"
+        r"|(?P<remote_rule>UPDATE|NOREMOTE)"
+        r"|(?P<attribute>MANUAL|RECURSIVE))(?=\s)"
+    )
 
     def __init__(self, content: str):
         self.content = content
@@ -76,50 +87,66 @@ class BundleLine:
         self.project = BundleLinePart("PROJECT", False, match.group(1))
         self.project_name = match.group(1)
 
-        # Parsing the git url or source path, these must be present and are mutually exclusive.
-        # Parse the git url
-        match = self._git_re.match(content)
-        if match:
-            self.source_reference = BundleLinePart("GIT", False, match.group(1), quote_char='"')
+        git_uri = None
+        source_path = None
+        attributes = []
+        for token in self._token_re.finditer(content, match.end()):
+            kind = token.lastgroup
+            if kind == 'git':
+                git_uri = token.group('git')
+            elif kind == 'source':
+                source_path = token.group('source')
+            elif kind == 'version_ref':
+                version_ref_type = token.group('version_ref_type')
+                self.version_ref_type = version_ref_type.lower()
+                self.version_ref = BundleLinePart(
+                    version_ref_type, False, token.group('version_ref'))
+            elif kind == 'remote_rule':
+                self.remote_rule = BundleLinePart(token.group('remote_rule'), True)
+            elif token.group('attribute') not in attributes:
+                attributes.append(token.group('attribute'))
+
+        # The git url or source path must be present and they are mutually exclusive.
+        if git_uri and source_path:
+            raise ValueError(f"Invalid bundle; git and source cannot both be present\n {content}")
+        if git_uri:
+            self.source_reference = BundleLinePart("GIT", False, git_uri, quote_char='"')
             self.source_reference_type = "git"
-            git_uri = match.group(1).lower()
+            git_uri = git_uri.lower()
             if 'github.com' in git_uri:
                 repo, org = github_client.get_repo_tuple_from_github_uri(git_uri)
                 self.github_org_repo_key = f'{org}/{repo}'
-        # Parse the source path
-        match = self._source_re.match(content)
-        if match and self.source_reference_type == "git":
-            raise ValueError(f"Invalid bundle; git and source cannot both be present\n {content}")
-        elif match:
-            self.source_reference = BundleLinePart("SOURCE", False, match.group(1))
+        elif source_path:
+            self.source_reference = BundleLinePart("SOURCE", False, source_path)
             self.source_reference_type = "source"
-
-        if not self.source_reference_type:
+        else:
             raise ValueError(f"Invalid bundle; no git or source\n {content}")
 
-        # Parsing the branch or tag, these are optional (not used by source path) but if
-        # present they are mutually exclusive..
-        match = self._branch_or_tag_re.match(content)
-        if match:
-            self.version_ref_type = match.group(1).lower()
-            self.version_ref = BundleLinePart(match.group(1), False, match.group(2))
+        # MANUAL and RECURSIVE are appended as attributes in the order given.
+        for attribute in attributes:
+            self.components.append(BundleLinePart(attribute, True))
 
-        match = self._remote_rule_re.match(content)
-        if match:
-            self.remote_rule = BundleLinePart(match.group(1), True)
+        # The project and trailing attributes are never rewritten so they are
+        # rendered once here rather than on every call to rewrite().
+        self._project_str = str(self.project)
+        self._tail_str = " ".join(str(c) for c in self.components)
+        self._disabled_line = f"# {content}"
 
-        # Parse both manual and recurive appending each as an attribute.
-        match = self._manual_and_recursive_re.match(content)
-        if match:
-            for m in match.groups():
-                if m:
-                    self.components.append(BundleLinePart(m, True))
+    @classmethod
+    @functools.lru_cache(maxsize=4096)
+    def parse(cls, content: str) -> "BundleLine":
+        """Parse a bundle line, reusing the result for a previously parsed line.
+
+        BundleLine objects are not modified after parsing (rewrites return new
+        strings) so cached instances can be shared between files and threads.
+        """
+        return cls(content)
 
     def original_line(self):
         return self.content
 
     def disabled_line(self):
-        return f"# {self.content}"
+        return self._disabled_line
 
     def rewrite_original(self):
         """Render the original line with the original components; used for testing."""
@@ -150,13 +177,13 @@ class BundleLine:
             remote_rule = None
         version_ref = version_ref or self.version_ref
 
-        # Create list of components to render.
-        render_components = [self.project, source_reference, version_ref]
+        # Render the rewritten components between the pre-rendered project and tail.
+        parts = [self._project_str, str(source_reference), str(version_ref)]
         if remote_rule:
-            render_components.append(remote_rule)
-        render_components += self.components
-        content = " ".join([str(c) for c in render_components])
-        return f"ecbuild_bundle( {content} )"
+            parts.append(str(remote_rule))
+        if self._tail_str:
+            parts.append(self._tail_str)
+        return f"ecbuild_bundle( {' '.join(parts)} )"
 
 
 class CMakeFile:
@@ -166,16 +193,42 @@ class CMakeFile:
     _ecbuild_bundle_re = re.compile(r"\s*ecbuild_bundle\s*\(.*")
 
     def __init__(self, original_content: str):
-        lines = original_content.splitlines()
-        self.lines = []
-        self.bundle_lines = {}
-        self.bundle_line_names = {}
-        for i, line in enumerate(lines):
-            self.lines.append(line)
-            if self._ecbuild_bundle_re.match(line):
-                bundle_line = BundleLine(line)
-                self.bundle_lines[i] = bundle_line
-                self.bundle_line_names[bundle_line.project_name] = bundle_line
+        self._parse_lines(original_content.splitlines())
+
+    @classmethod
+    def from_stream(cls, file_object: Iterable[str]) -> "CMakeFile":
+        """Parse a CMakeFile line by line from a text file object.
+
+        This avoids reading the whole file into a single string before it is
+        split into lines by the parser.
+        """
+        cmake_file = cls.__new__(cls)
+        cmake_file._parse_lines(line.rstrip('\r\n') for line in file_object)
+        return cmake_file
+
+    def _parse_lines(self, lines: Iterable[str]):
+        # Each row pairs a line with its parsed BundleLine (or None) so that a
+        # rewrite walks the rows without looking lines up by index.
+        bundle_match = self._ecbuild_bundle_re.match
+        self._rows = [
+            (line, BundleLine.parse(line) if bundle_match(line) else None)
+            for line in lines
+        ]
+        self.lines = [line for line, _ in self._rows]
+        self.bundle_lines = {
+            i: bundle_line
+            for i, (_, bundle_line) in enumerate(self._rows)
+            if bundle_line is not None
+        }
+
+    @functools.cached_property
+    def bundle_line_names(self) -> Dict[str, BundleLine]:
+        """Map of project name to bundle line; a later line wins on duplicates."""
+        return {b.project_name: b for b in self.bundle_lines.values()}
+
+    @functools.cached_property
+    def _all_bundle_names(self) -> frozenset[str]:
+        return frozenset(self.bundle_line_names)
 
     def get_github_urls(self):
         url_map = {}
@@ -220,43 +273,55 @@ class CMakeFile:
         if rewrite_rules and build_group_commit_map:
             raise ValueError("rewrite_rules and build_group_commit_map cannot both be provided")
 
-        lines = []
-        for i, line in enumerate(self.lines):
+        # Lines are written as they are produced; the file object's own buffer
+        # batches the writes so no copy of the output is held in memory.
+        write = file_object.write
+
+        # When every bundle is enabled and nothing is rewritten the output is
+        # the original lines, so skip the per-line bundle checks entirely.
+        if (not rewrite_rules and not build_group_commit_map
+                and all(name in enabled_bundles for name in self._all_bundle_names)):
+            for line in self.lines:
+                write(line)
+                write('\n')
+            return
+
+        for line, bundle_line in self._rows:
             # Each line that is not a bundle is left unchanged.
-            if i not in self.bundle_lines:
-                lines.append(line + '\n')
+            if bundle_line is None:
+                write(line)
+                write('\n')
                 continue
 
-            bundle_line = self.bundle_lines[i]
             # If the line is a bundle we need to determine if/how it should be rewritten.
             if bundle_line.project_name not in enabled_bundles:
-                lines.append(bundle_line.disabled_line() + '\n')
+                write(bundle_line.disabled_line())
+                write('\n')
                 continue
 
             # Check if this bundle matches a github org/repo key in the build group commit map
-            if bundle_line.github_org_repo_key and bundle_line.github_org_repo_key in build_group_commit_map:  # noqa: E501
+            if build_group_commit_map and bundle_line.github_org_repo_key in build_group_commit_map:  # noqa: E501
                 # Use the commit hash as a tag
                 commit_info = build_group_commit_map[bundle_line.github_org_repo_key]
                 commit_hash = commit_info["version_ref"]["commit"]
-                lines.append(bundle_line.rewrite(tag=commit_hash) + '\n')
+                write(bundle_line.rewrite(tag=commit_hash))
+                write('\n')
                 continue
 
             # If the line has a rewrite rule, use it.
-            if bundle_line.project_name in rewrite_rules:
+            if rewrite_rules and bundle_line.project_name in rewrite_rules:
                 tag = rewrite_rules[bundle_line.project_name]
-                lines.append(bundle_line.rewrite(tag=tag) + '\n')
+                write(bundle_line.rewrite(tag=tag))
+                write('\n')
                 continue
 
             # Finally if the line is enabled and has no rewrite, use the original line.
-            lines.append(bundle_line.original_line() + '\n')
-
-        # Write the lines to the file.
-        file_object.writelines(lines)
+            write(bundle_line.original_line())
+            write('\n')
 
     def basic_rewrite(self, file_object):
         """Rewrite the CMakeFile object to the file_object."""
-        enabled_bundles = set(self.bundle_line_names.keys())
-        self._rewrite_file_implementation(file_object, enabled_bundles=enabled_bundles)
+        self._rewrite_file_implementation(file_object, enabled_bundles=self._all_bundle_names)
 
     def rewrite_whitelist(self,
                           file_object,
@@ -270,9 +335,7 @@ class CMakeFile:
                           disabled_bundles: Container[str],
                           rewrite_rules: dict[str, str]):
         """Rewrite the CMakeFile object to the file_object."""
-        enabled_bundles = set(self.bundle_line_names.keys())
-        for bundle in disabled_bundles:
-            enabled_bundles.discard(bundle)
+        enabled_bundles = self._all_bundle_names.difference(disabled_bundles)
         self._rewrite_file_implementation(file_object, enabled_bundles, rewrite_rules)
 
     def rewrite_build_group_whitelist(self,
@@ -287,7 +350,5 @@ class CMakeFile:
                                       disabled_bundles: Container[str],
                                       build_group_commit_map: Dict[str, Dict[str, Any]]):
         """Rewrite the CMakeFile object to the file_object."""
-        enabled_bundles = set(self.bundle_line_names.keys())
-        for bundle in disabled_bundles:
-            enabled_bundles.discard(bundle)
+        enabled_bundles = self._all_bundle_names.difference(disabled_bundles)
         self._rewrite_file_implementation(file_object, enabled_bundles, build_group_commit_map=build_group_commit_map)  # noqa: E501
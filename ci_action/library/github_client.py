@@ -5,10 +5,12 @@ currently implemented it doesn't do too much but exists to support
 the implementation inhereted from the GitHub Lambda function which
 required a more complex app-integration client
 """
+import concurrent.futures
+import functools
 import github
 import logging
 import os
-from functools import lru_cache
+import threading
 import datetime
 
 LOG = logging.getLogger("github_client")
@@ -18,12 +20,120 @@ GITHUB_URI = "https://github.com/"
 UNIT_TEST_PREFIX = 'JEDI unit test'
 INTEGRATION_TEST_PREFIX = 'JEDI integration test'
 
+# The JEDI CI GitHub App; check runs created with its token (JEDI_CI_TOKEN)
+# belong to this app so older runs can be looked up by app on the server.
+JEDI_CI_APP_ID = int(os.environ.get('JEDI_CI_APP_ID', '321361'))
+
+# Check runs are created and cancelled from several threads at once. Bursts of
+# concurrent writes to one repository trip GitHub's secondary rate limits, so
+# the number of in-flight write requests is capped across all clients.
+MAX_CONCURRENT_WRITES = 3
+_write_semaphore = threading.BoundedSemaphore(MAX_CONCURRENT_WRITES)
+
+
+# Check runs on the most recent commits of a PR are read with one GraphQL
+# request instead of one REST request per commit. When the app that created
+# the JEDI runs is known the check suites are filtered to that app on the
+# server. Check suites are read 10 at a time; a commit with more suites (e.g.
+# Actions, Codecov and other apps) has its remaining suites read with
+# _COMMIT_CHECK_SUITES_QUERY. Up to 50 runs per suite are returned, which
+# covers the JEDI runs (6 per commit).
+_CHECK_SUITES_FIELDS = """
+              pageInfo { hasNextPage endCursor }
+              nodes {
+                checkRuns(first: 50) {
+                  nodes { databaseId name status startedAt }
+                }
+              }
+"""
+
+_PR_CHECK_RUNS_QUERY = """
+query($owner: String!, $repo: String!, $pr: Int!, $historyLimit: Int!,
+      $suiteFilter: CheckSuiteFilter) {
+  repository(owner: $owner, name: $repo) {
+    pullRequest(number: $pr) {
+      commits(last: $historyLimit) {
+        nodes {
+          commit {
+            oid
+            checkSuites(first: 10, filterBy: $suiteFilter) {%s}
+          }
+        }
+      }
+    }
+  }
+}
+""" % _CHECK_SUITES_FIELDS
+
+_COMMIT_CHECK_SUITES_QUERY = """
+query($owner: String!, $repo: String!, $oid: GitObjectID!, $after: String!,
+      $suiteFilter: CheckSuiteFilter) {
+  repository(owner: $owner, name: $repo) {
+    object(oid: $oid) {
+      ... on Commit {
+        checkSuites(first: 10, after: $after, filterBy: $suiteFilter) {%s}
+      }
+    }
+  }
+}
+""" % _CHECK_SUITES_FIELDS
+
+
+# The unit and integration check runs for a build environment are created
+# together with one GraphQL document holding two aliased mutations.
+_CREATE_CHECK_RUNS_MUTATION = """
+mutation($repositoryId: ID!, $headSha: GitObjectID!, $unitName: String!,
+         $integrationName: String!) {
+  unit: createCheckRun(input: {repositoryId: $repositoryId, headSha: $headSha,
+                               name: $unitName, status: QUEUED}) {
+    checkRun { databaseId }
+  }
+  integration: createCheckRun(input: {repositoryId: $repositoryId, headSha: $headSha,
+                                      name: $integrationName, status: QUEUED}) {
+    checkRun { databaseId }
+  }
+}
+"""
+
+# GraphQL node ids of repositories keyed by (owner, repo). The ids are plain
+# strings so, unlike repository handles, they are shared by all threads.
+_repository_node_ids = {}
+_repository_node_ids_lock = threading.Lock()
+
+
+def _parse_pr_check_runs(data: dict) -> list:
+    """Flatten a _PR_CHECK_RUNS_QUERY response into per-commit check runs.
+
+    Returns a list of (commit_sha, check_runs) tuples ordered newest->oldest
+    where each check run is a dict with "id", "name", "status" (lower case,
+    matching the REST API) and "started_at" (an aware datetime or None).
+    """
+    commit_nodes = data['data']['repository']['pullRequest']['commits']['nodes']
+    commits = []
+    for commit_node in reversed(commit_nodes):
+        commit = commit_node['commit']
+        check_runs = []
+        for suite in commit['checkSuites']['nodes']:
+            for run in suite['checkRuns']['nodes']:
+                started_at = run['startedAt']
+                if started_at:
+                    started_at = datetime.datetime.fromisoformat(started_at.replace('Z', '+00:00'))
+                check_runs.append({
+                    'id': run['databaseId'],
+                    'name': run['name'],
+                    'status': run['status'].lower(),
+                    'started_at': started_at,
+                })
+        commits.append((commit['oid'], check_runs))
+    return commits
+
+
+_JEDI_CHECK_RUN_PREFIXES = (UNIT_TEST_PREFIX, INTEGRATION_TEST_PREFIX)
+
 
 def _check_run_name_is_jedi(check_run_name: str) -> bool:
     """Check if a check run name is a JEDI unit or integration test."""
-    starts_with_unit_test = check_run_name.startswith(UNIT_TEST_PREFIX)
-    starts_with_integration_test = check_run_name.startswith(INTEGRATION_TEST_PREFIX)
-    return starts_with_unit_test or starts_with_integration_test
+    return check_run_name.startswith(_JEDI_CHECK_RUN_PREFIXES)
 
 
 class GitHubAppClientManager(object):
@@ -47,19 +157,29 @@ class GitHubAppClientManager(object):
     a personal access token is used then app credentials cannot be used.
     """
 
-    def __init__(self, personal_access_token: str):
-        """Initialize the GitHubAppClientManager."""
+    def __init__(self, personal_access_token: str, app_id: int = None):
+        """Initialize the GitHubAppClientManager.
+
+        Args:
+            personal_access_token: The token used to authenticate requests.
+            app_id: The GitHub App the token belongs to, if known. Check runs
+                created with the token belong to this app.
+        """
         LOG.info(f'Initializing GitHubAppClientManager with personal_access_token, string of length {len(personal_access_token)}')  # noqa: E501
         if not personal_access_token:
             raise ValueError("argument personal_access_token is required and must be a non-empty string")  # noqa: E501
         self.client = github.Github(personal_access_token)
+        self.app_id = app_id
+        # Repository handles keyed by (owner, repo); see get_repository.
+        self._repositories = {}
 
     @classmethod
     def init_from_environment(cls):
         # If environment variable JEDI_CI_TOKEN is set, use it to create a client.
         # This is the preferred token used in the GitHub Action workflow.
         if 'JEDI_CI_TOKEN' in os.environ:
-            return cls(personal_access_token=os.environ['JEDI_CI_TOKEN'])
+            return cls(personal_access_token=os.environ['JEDI_CI_TOKEN'],
+                       app_id=JEDI_CI_APP_ID)
 
         # If environment variable GITHUB_TOKEN is set, use it to create a client.
         if 'GITHUB_TOKEN' in os.environ:
@@ -75,18 +195,107 @@ class GitHubAppClientManager(object):
             'Environment must have "JEDI_CI_TOKEN", "GITHUB_TOKEN", or "GITHUB_TOKEN_FILE" vars')
 
     def get_repository(self, repo, owner):
-        LOG.info(f'Fetching repository {owner}/{repo}')
-        return self.client.get_repo(f'{owner}/{repo}')
-
-    def create_check_run(self, repo, owner, commit, run_name):
-        """Create a new GitHub check run."""
-        repo = self.get_repository(repo, owner)
-        check_run = repo.create_check_run(
-            run_name,
-            commit,
-            status='queued',
+        """Fetch a repository, reusing the handle from any earlier fetch.
+
+        Repository handles are bound to this manager's client and do not change
+        for the life of a CI run, so each repository is fetched only once.
+        """
+        key = (owner, repo)
+        repository = self._repositories.get(key)
+        if repository is None:
+            LOG.info(f'Fetching repository {owner}/{repo}')
+            repository = self.client.get_repo(f'{owner}/{repo}')
+            self._repositories[key] = repository
+        return repository
+
+    def get_repository_node_id(self, repo, owner):
+        """Get the GraphQL node id of a repository (fetched once per process).
+
+        Launch threads look up the same repository concurrently; the lock makes
+        the first of them fetch it while the others wait and reuse the id.
+        """
+        key = (owner, repo)
+        with _repository_node_ids_lock:
+            node_id = _repository_node_ids.get(key)
+            if node_id is None:
+                node_id = self.get_repository(repo, owner).node_id
+                _repository_node_ids[key] = node_id
+        return node_id
+
+    def create_unit_and_integration_check_runs(
+            self, repo, owner, commit, unit_run_name, integration_run_name):
+        """Create queued unit and integration check runs in a single request.
+
+        Returns:
+            A ("unit", "integration") dict of the created check run ID's.
+        """
+        repository_id = self.get_repository_node_id(repo, owner)
+        with _write_semaphore:
+            _, data = self.client.requester.graphql_query(
+                _CREATE_CHECK_RUNS_MUTATION,
+                {
+                    'repositoryId': repository_id,
+                    'headSha': commit,
+                    'unitName': unit_run_name,
+                    'integrationName': integration_run_name,
+                },
+            )
+        return {
+            'unit': data['data']['unit']['checkRun']['databaseId'],
+            'integration': data['data']['integration']['checkRun']['databaseId'],
+        }
+
+    def skip_check_run(self, repo, owner, check_run_id):
+        """Mark an unfinished check run as skipped (preempted by a newer test)."""
+        with _write_semaphore:
+            self.client.requester.requestJsonAndCheck(
+                'PATCH',
+                f'/repos/{owner}/{repo}/check-runs/{check_run_id}',
+                input={
+                    'status': 'completed',
+                    'conclusion': 'skipped',
+                    'output': {'title': 'preempted by newer test', 'summary': '', 'text': ''},
+                },
+            )
+
+    def _fetch_recent_pr_check_runs(self, repo, owner, pr_number, history_limit):
+        """Fetch check runs for the last `history_limit` commits of a PR.
+
+        Returns a list of (commit_sha, check_runs) ordered newest->oldest; see
+        _parse_pr_check_runs for the check run format.
+        """
+        suite_filter = {'appId': self.app_id} if self.app_id else None
+        _, data = self.client.requester.graphql_query(
+            _PR_CHECK_RUNS_QUERY,
+            {
+                'owner': owner,
+                'repo': repo,
+                'pr': int(pr_number),
+                'historyLimit': history_limit,
+                'suiteFilter': suite_filter,
+            },
         )
-        return check_run
+        # Read the remaining check suites of commits with more than one page so
+        # that the JEDI suite is found among the suites of other apps.
+        for commit_node in data['data']['repository']['pullRequest']['commits']['nodes']:
+            commit = commit_node['commit']
+            check_suites = commit['checkSuites']
+            page_info = check_suites['pageInfo']
+            while page_info['hasNextPage']:
+                _, page = self.client.requester.graphql_query(
+                    _COMMIT_CHECK_SUITES_QUERY,
+                    {
+                        'owner': owner,
+                        'repo': repo,
+                        'oid': commit['oid'],
+                        'after': page_info['endCursor'],
+                        'suiteFilter': suite_filter,
+                    },
+                )
+                page_suites = page['data']['repository']['object']['checkSuites']
+                check_suites['nodes'].extend(page_suites['nodes'])
+                page_info = page_suites['pageInfo']
+        return _parse_pr_check_runs(data)
 
     def cancel_prior_unfinished_check_runs(self, repo, owner, pr_number, history_limit=20):
         """Cancel any unfinished check runs on older commits of a PR.
@@ -97,31 +306,28 @@ class GitHubAppClientManager(object):
             pr_number: The number of the PR.
             history_limit: Number of recent commits to consider (manages performance).
         """
-        r = self.get_repository(repo, owner)
-        pr = r.get_pull(pr_number)
-        # This is the most recent commit on the PR listed in chronological order (oldest->newest).
-        commits = list(pr.get_commits())
-        commits.reverse()  # Reverse list to get newest->oldest ordering.
+        # The PR's recent commits (newest->oldest) and their check runs.
+        commits = self._fetch_recent_pr_check_runs(repo, owner, pr_number, history_limit)
 
         if len(commits) < 1:
             LOG.warning(f'No commits found for PR {pr_number}')
             return
 
-        # Get the most recent commits (up to the `history_limit`) and discard
-        # the trigger commit.
-        trigger_commit = commits[0]
-        commits = commits[1:history_limit]
+        # The newest commit is the trigger commit; the rest are older commits
+        # within the `history_limit`.
+        _, trigger_check_runs = commits[0]
+        commits = commits[1:]
 
         # Go through each commit and cancel any unfinished check runs. Once a
         # commit is visited that has check runs, stop (since older commits will
         # have already been checked).
+        skipped_check_run_ids = []
         found_jedi_check_runs = False
-        for commit in commits:
+        for _, check_runs in commits:
             if found_jedi_check_runs:
                 break
-            check_runs = commit.get_check_runs()
             for check_run in check_runs:
-                if not _check_run_name_is_jedi(check_run.name):
+                if not _check_run_name_is_jedi(check_run['name']):
                     continue
 
                 # Once ANY JEDI check runs are found, end further processing of older commits
@@ -130,33 +336,43 @@ class GitHubAppClientManager(object):
                 found_jedi_check_runs = True
 
                 # Only update status unfinished check runs.
-                if check_run.status in ['queued', 'in_progress']:
-                    LOG.info(f'Cancelling unfinished check run "{check_run.id}"')
-                    check_run.edit(
-                        status='completed',
-                        conclusion='skipped',
-                        output={'title': 'preempted by newer test', 'summary': '', 'text': ''},
-                    )
+                if check_run['status'] in ['queued', 'in_progress']:
+                    LOG.info(f'Cancelling unfinished check run "{check_run["id"]}"')
+                    skipped_check_run_ids.append(check_run['id'])
 
         # Evaluate the current commit to see if it has any "old" check runs. This commit
         # Is handled separately since we want to continue processing older commits even
         # if the current commit has a JEDI check run. Additionally we use a 10-minute
         # heuristic to avoid updating the status of check runs that are launched
         # by this current run
-        for check_run in trigger_commit.get_check_runs():
-            if not _check_run_name_is_jedi(check_run.name):
+        for check_run in trigger_check_runs:
+            if not _check_run_name_is_jedi(check_run['name']):
                 continue
-            # Ignore checks launched in the last 10 minutes (could be from this workflow run).
+            # Ignore checks launched in the last 10 minutes (could be from this workflow
+            # run) and checks that have not started yet.
+            started_at = check_run['started_at']
             time_now = datetime.datetime.now(datetime.timezone.utc)
-            if time_now - check_run.started_at < datetime.timedelta(minutes=10):
+            if started_at is None or time_now - started_at < datetime.timedelta(minutes=10):
                 continue
-            if check_run.status in ['queued', 'in_progress']:
-                LOG.info(f'Cancelling unfinished check run {check_run.id} on current commit')
-                check_run.edit(
-                    status='completed',
-                    conclusion='skipped',
-                    output={'title': 'preempted by newer test', 'summary': '', 'text': ''},
-                )
+            if check_run['status'] in ['queued', 'in_progress']:
+                LOG.info(f'Cancelling unfinished check run {check_run["id"]} on current commit')
+                skipped_check_run_ids.append(check_run['id'])
+
+        if not skipped_check_run_ids:
+            return
+
+        # The edits are independent so they are sent concurrently, bounded by
+        # the write semaphore. Each worker thread uses its own cached client
+        # (see get_client); the first failure is raised once all are attempted.
+        def skip_check_run(check_run_id):
+            get_client().skip_check_run(repo, owner, check_run_id)
+
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=MAX_CONCURRENT_WRITES) as executor:
+            futures = [executor.submit(skip_check_run, check_run_id)
+                       for check_run_id in skipped_check_run_ids]
+        for future in futures:
+            future.result()
 
 
 def cancel_prior_unfinished_check_runs(repo, owner, pr_number, history_limit=20):
@@ -168,7 +384,7 @@ def cancel_prior_unfinished_check_runs(repo, owner, pr_number, history_limit=20)
             pr_number: The number of the PR.
             history_limit: The number of recent commits to consider (manages performance).
     """
-    github_app = GitHubAppClientManager.init_from_environment()
+    github_app = get_client()
     return github_app.cancel_prior_unfinished_check_runs(repo, owner, pr_number, history_limit)
 
 
@@ -192,20 +408,32 @@ def create_check_runs(build_environment, repo, owner, trigger_commit, next_suffi
         }
     """
     build_environment_name = build_environment + next_suffix
-    github_app = GitHubAppClientManager.init_from_environment()
     unit_run_name = f'{UNIT_TEST_PREFIX}: {build_environment_name}'
     integration_run_name = f'{INTEGRATION_TEST_PREFIX}: {build_environment_name}'
-    unit_run = github_app.create_check_run(
-        repo, owner, trigger_commit, unit_run_name)
-    integration_run = github_app.create_check_run(
-        repo, owner, trigger_commit, integration_run_name)
-    return {'unit': unit_run.id, 'integration': integration_run.id}
+
+    return get_client().create_unit_and_integration_check_runs(
+        repo, owner, trigger_commit, unit_run_name, integration_run_name)
+
+
+_thread_local = threading.local()
 
 
-@lru_cache(maxsize=1)
 def get_client():
-    """Lazily initialize and cache the GitHub client manager from environment."""
-    return GitHubAppClientManager.init_from_environment()
+    """Lazily initialize and cache the GitHub client manager from environment.
+
+    The pygithub Requester's connection lock only guards creating its single
+    persistent connection. Each request then stores its verb, url and headers
+    on that shared connection object between request() and getresponse(), and
+    the write throttle bookkeeping is unsynchronized, so concurrent requests on
+    one client can send each other's requests. One client is cached per
+    thread; per-process lookups such as repository node ids are shared through
+    module-level caches so threads do not repeat them.
+    """
+    client = getattr(_thread_local, 'client', None)
+    if client is None:
+        client = GitHubAppClientManager.init_from_environment()
+        _thread_local.client = client
+    return client
 
 
 def validate_github_uri(repo_uri: str) -> str:
@@ -225,8 +453,12 @@ def get_fullname_from_github_uri(repo_uri: str) -> str:
     return repo_path
 
 
+@functools.lru_cache(maxsize=None)
 def get_repo_tuple_from_github_uri(repo_uri: str) -> str:
-    """Converts https://github.com/org/repo.git into a ("repo", "org") tuple."""
+    """Converts https://github.com/org/repo.git into a ("repo", "org") tuple.
+
+    The result is cached since the same bundle URIs are parsed repeatedly.
+    """
     full_repo = get_fullname_from_github_uri(repo_uri)
     org, repo = full_repo.split('/', 1)
     return repo, org
@@ -1,3 +1,4 @@
+import functools
 import logging
 import re
 from typing import Any, Mapping, NamedTuple, Union
@@ -208,21 +209,56 @@ def get_build_group_pr_map(build_group_members):
     return pr_map
 
 
-def gather_build_group_hashes(build_group_mapping):
-    """Colects the commit hash for each repository in the build group."""
+@functools.lru_cache(maxsize=512)
+def get_pull_request_head(org, repo, pr_number):
+    """Fetch the clone URI and head branch and commit of a pull request.
+
+    Returns:
+        A (clone_uri, pr_number, branch, commit) tuple.
+    """
+    grepo = github_client.get_client().get_repository(repo, org)
+    pr = grepo.get_pull(pr_number)
+    return grepo.clone_url, pr.number, pr.head.ref, pr.head.sha
+
+
+def get_pull_request_head_from_payload(pr_payload):
+    """Read the same values as `get_pull_request_head` from a PR event payload."""
+    return (
+        pr_payload['base']['repo']['clone_url'],
+        pr_payload['number'],
+        pr_payload['head']['ref'],
+        pr_payload['head']['sha'],
+    )
+
+
+def gather_build_group_hashes(build_group_mapping, pr_payloads=None):
+    """Colects the commit hash for each repository in the build group.
+
+    Args:
+        build_group_mapping: A mapping of "org/repo" keys to PR numbers.
+        pr_payloads: An optional mapping of "org/repo" keys to pull request
+                     payloads that are already known (such as the PR that
+                     triggered the test). These are used instead of fetching
+                     the pull request from GitHub.
+    """
     pr_group_map_out = {}
+    pr_payloads = pr_payloads or {}
 
     for repo_name_key, pr_number in build_group_mapping.items():
-        org, repo = repo_name_key.split('/')
-        grepo = github_client.get_client().get_repository(repo, org)
-        pr = grepo.get_pull(pr_number)
+        pr_payload = pr_payloads.get(repo_name_key)
+        if pr_payload and pr_payload.get('number') == pr_number:
+            pr_head = get_pull_request_head_from_payload(pr_payload)
+        else:
+            org, repo = repo_name_key.split('/')
+            pr_head = get_pull_request_head(org, repo, pr_number)
+        clone_uri, pr_id, branch, commit = pr_head
         pr_group_map_out[repo_name_key] = {
             "name_key": repo_name_key,
-            "uri": grepo.clone_url,
+            "uri": clone_uri,
             "version_ref": {
-                "pr_id": pr.number,
-                "branch": pr.head.ref,
-                "commit": pr.head.sha,
+                "pr_id": pr_id,
+                "branch": branch,
+                "commit": commit,
             },
         }
     return pr_group_map_out
@@ -6,14 +6,14 @@ implementation of the CI action.
 """
 
 import argparse
-import json
 import logging
 import os
 import pathlib
-import subprocess
 import sys
 import textwrap
 
+import orjson
+
 from ci_action import implementation as ci_implementation
 
 
@@ -41,14 +41,6 @@ logging.basicConfig(
 LOG = logging.getLogger("entrypoint")
 
 
-def check_output(args, **kwargs):
-    """
-    Wrapper around subprocess.check_output that logs the command and its output.
-    """
-    LOG.info(f"Running command: {' '.join(args)}")
-    return subprocess.check_output(args, **kwargs)
-
-
 def setup_git_credentials(github_token):
     """
     Setup Git credentials using the JEDI_CI_TOKEN environment variable.
@@ -59,7 +51,7 @@ def setup_git_credentials(github_token):
         LOG.info("JEDI_CI_TOKEN is set. Setting up Git credentials.")
 
         # Configure git to use the credential store
-        check_output(
+        ci_implementation.run_quiet(
             ["git", "config", "--global", "credential.helper", "store"],
         )
         # Write the ~/.git-credentials file
@@ -86,8 +78,8 @@ def get_environment_config():
         raise ValueError("GITHUB_REPOSITORY environment variable is required")
     owner, repo_name = repository.split('/')
     github_event_path = os.environ.get('GITHUB_EVENT_PATH')
-    with open(github_event_path, 'r') as f:
-        event = json.load(f)
+    with open(github_event_path, 'rb') as f:
+        event = orjson.loads(f.read())
 
     if event.get('pull_request'):
         branch_name = event['pull_request']['head']['ref']
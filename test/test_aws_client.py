@@ -0,0 +1,175 @@
+import unittest
+from unittest import mock
+
+from ci_action.library import aws_client
+
+JOB_NAME_MAP = {
+    'gcc11': 'jedi-ci-gcc11',
+    'gcc': 'jedi-ci-gcc',
+    'intel': 'jedi-ci-intel',
+    'gcc11-next': 'jedi-ci-gcc11-next',
+    'gcc-next': 'jedi-ci-gcc-next',
+    'intel-next': 'jedi-ci-intel-next',
+}
+
+
+def _job_definition(name, revision):
+    return {
+        'jobDefinitionName': name,
+        'revision': revision,
+        'jobDefinitionArn': f'arn:aws:batch:us-east-2:1:job-definition/{name}:{revision}',
+    }
+
+
+def _batch_client(pages):
+    """A Batch client mock whose paginators return `pages`."""
+    client = mock.Mock()
+    client.get_paginator.return_value.paginate.return_value = pages
+    return client
+
+
+class TestGetLatestJobDefinitionArns(unittest.TestCase):
+
+    def setUp(self):
+        aws_client.get_latest_job_definition_arns.cache_clear()
+        self.addCleanup(aws_client.get_latest_job_definition_arns.cache_clear)
+
+    def test_latest_revision_across_pages(self):
+        client = _batch_client([
+            {'jobDefinitions': [_job_definition('jedi-ci-gcc', 3),
+                                _job_definition('jedi-ci-intel', 1)]},
+            {'jobDefinitions': [_job_definition('jedi-ci-gcc', 5),
+                                _job_definition('jedi-ci-intel', 2)]},
+            {'jobDefinitions': [_job_definition('jedi-ci-gcc', 4)]},
+        ])
+        with mock.patch.object(aws_client, 'get_batch_client', return_value=client):
+            got = aws_client.get_latest_job_definition_arns()
+        client.get_paginator.assert_called_once_with('describe_job_definitions')
+        client.get_paginator.return_value.paginate.assert_called_once_with(status='ACTIVE')
+        self.assertDictEqual(got, {
+            'jedi-ci-gcc': 'arn:aws:batch:us-east-2:1:job-definition/jedi-ci-gcc:5',
+            'jedi-ci-intel': 'arn:aws:batch:us-east-2:1:job-definition/jedi-ci-intel:2',
+        })
+
+    def test_builder_resolves_every_environment(self):
+        client = _batch_client([
+            {'jobDefinitions': [_job_definition(name, 1) for name in JOB_NAME_MAP.values()]},
+        ])
+        with mock.patch.object(aws_client, 'get_batch_client', return_value=client):
+            builder = aws_client.BatchSubmitConfigBuilder(
+                JOB_NAME_MAP, 'arn:aws:batch:queue', timeout=60)
+        config = builder.get_config('intel-next')
+        self.assertEqual(config.job_definition,
+                         'arn:aws:batch:us-east-2:1:job-definition/jedi-ci-intel-next:1')
+        client.get_paginator.assert_called_once()
+
+    def test_builder_missing_job_definition(self):
+        client = _batch_client([
+            {'jobDefinitions': [_job_definition('jedi-ci-gcc', 1)]},
+        ])
+        with mock.patch.object(aws_client, 'get_batch_client', return_value=client):
+            with self.assertRaisesRegex(EnvironmentError, 'jedi-ci-gcc11'):
+                aws_client.BatchSubmitConfigBuilder(
+                    JOB_NAME_MAP, 'arn:aws:batch:queue', timeout=60)
+
+
+class TestCancelPriorBatchJobs(unittest.TestCase):
+
+    @staticmethod
+    def _job(name, status, job_id):
+        return {'jobName': name, 'status': status, 'jobId': job_id}
+
+    def _cancel(self, client):
+        with mock.patch.object(aws_client, 'get_batch_client', return_value=client):
+            return aws_client.cancel_prior_batch_jobs('arn:aws:batch:queue', 'oops', 5)
+
+    def test_unfinished_jobs_are_stopped(self):
+        client = _batch_client([
+            {'jobSummaryList': [
+                self._job('jedi-ci-oops-5-abc-gcc', 'RUNNING', 'running'),
+                self._job('jedi-ci-oops-5-abc-intel', 'SUCCEEDED', 'succeeded'),
+            ]},
+            {'jobSummaryList': [
+                self._job('jedi-ci-oops-5-abc-gcc11', 'RUNNABLE', 'runnable'),
+                # The server-side filter is case-insensitive.
+                self._job('jedi-ci-OOPS-5-abc-gcc', 'RUNNING', 'other-repo'),
+            ]},
+        ])
+        cancelled = self._cancel(client)
+
+        client.get_paginator.assert_called_once_with('list_jobs')
+        self.assertEqual(sorted(job['jobId'] for job in cancelled), ['runnable', 'running'])
+        client.terminate_job.assert_called_once_with(
+            jobId='running', reason='Preempted by new test run')
+        client.cancel_job.assert_called_once_with(
+            jobId='runnable', reason='Preempted by new test run')
+
+    def test_failures_are_raised_after_all_attempts(self):
+        client = _batch_client([
+            {'jobSummaryList': [
+                self._job('jedi-ci-oops-5-abc-gcc', 'RUNNING', 'fails'),
+                self._job('jedi-ci-oops-5-abc-intel', 'RUNNING', 'works'),
+                self._job('jedi-ci-oops-5-abc-gcc11', 'PENDING', 'pending'),
+            ]},
+        ])
+
+        def terminate_job(jobId, reason):
+            if jobId == 'fails':
+                raise RuntimeError('job already finished')
+
+        client.terminate_job.side_effect = terminate_job
+        with self.assertRaisesRegex(RuntimeError, 'Failed to stop 1 jobs: .*gcc: job already'):
+            self._cancel(client)
+        self.assertEqual(client.terminate_job.call_count, 2)
+        client.cancel_job.assert_called_once()
+
+
+class TestSubmitTestBatchJob(unittest.TestCase):
+
+    def test_job_environment(self):
+        client = mock.Mock()
+        config = aws_client.BatchSubmitConfig(
+            job_definition='arn:aws:batch:job-definition/jedi-ci-gcc:1',
+            job_queue='arn:aws:batch:queue', timeout=60, build_environment='gcc')
+        with mock.patch.object(aws_client, 'get_batch_client', return_value=client):
+            aws_client.submit_test_batch_job(
+                config=config,
+                repo_name='oops',
+                repo_name_full='JCSDA-internal/oops',
+                commit='abc1234',
+                pr=5,
+                configured_bundle_tarball='s3://bucket/bundle.tar.gz',
+                debug_time_seconds=0,
+                build_identity='oops-5-abc1234-gcc',
+                unittest_tag='unit',
+                trigger_sha='abc1234def',
+                trigger_pr='5',
+                integration_run_id=12,
+                unit_run_id=11,
+                unittest_dependencies='ufo saber',
+                test_script='run_tests.sh',
+            )
+        kwargs = client.submit_job.call_args.kwargs
+        self.assertEqual(kwargs['jobName'], 'jedi-ci-oops-5-abc1234-gcc')
+        environment = {
+            variable['name']: variable['value']
+            for variable in kwargs['containerOverrides']['environment']
+        }
+        self.assertDictEqual(environment, {
+            'TRIGGER_REPO': 'oops',
+            'TRIGGER_REPO_FULL': 'JCSDA-internal/oops',
+            'BUILD_IDENTITY': 'oops-5-abc1234-gcc',
+            'DEBUG_TIME_SECONDS': '0',
+            'CONFIGURED_BUNDLE_TARBALL_S3': 's3://bucket/bundle.tar.gz',
+            'UNITTEST_TAG': 'unit',
+            'TRIGGER_SHA': 'abc1234def',
+            'TRIGGER_PR': '5',
+            'INTEGRATION_RUN_ID': '12',
+            'UNIT_RUN_ID': '11',
+            'UNIT_DEPENDENCIES': 'ufo saber',
+            'TEST_SCRIPT': 'run_tests.sh',
+        })
+
+
+if __name__ == "__main__":
+    unittest.main()
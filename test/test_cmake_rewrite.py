@@ -80,6 +80,19 @@ class TestBundleLine(unittest.TestCase):
         self.assertIn(f'GIT "{new_repo}"', new_line)
         self.assertTrue('myrepo.git' not in new_line or new_repo in new_line)
 
+    def test_parse_is_cached(self):
+        bl = BundleLine.parse(SIMPLE_GIT_BUNDLE_LINE)
+        self.assertIs(BundleLine.parse(SIMPLE_GIT_BUNDLE_LINE), bl)
+        self.assertEqual(bl.rewrite_original(), BundleLine(SIMPLE_GIT_BUNDLE_LINE).rewrite_original())
+
+    def test_parse_manual_and_recursive(self):
+        line = ('ecbuild_bundle( PROJECT myproject GIT "https://github.com/myorg/MyRepo.git" '
+                'BRANCH mybranch UPDATE MANUAL RECURSIVE )')
+        bl = BundleLine(line)
+        self.assertEqual(bl.remote_rule.name, 'UPDATE')
+        self.assertEqual([c.name for c in bl.components], ['MANUAL', 'RECURSIVE'])
+        self.assertEqual(bl.rewrite_original(), line)
+
 
 ORIGINAL_CMAKE_FILE = """
 cmake_minimum_required( VERSION 3.14 FATAL_ERROR )
@@ -137,6 +150,13 @@ class TestCMakeFile(unittest.TestCase):
         print(written_text)
         self.assertMultiLineEqual(written_text, ORIGINAL_CMAKE_FILE)
     
+    def test_from_stream_matches_string_parse(self):
+        cmake_file = CMakeFile.from_stream(StringIO(ORIGINAL_CMAKE_FILE))
+        self.assertEqual(cmake_file.lines, CMakeFile(ORIGINAL_CMAKE_FILE).lines)
+        fake_file = StringIO()
+        cmake_file.basic_rewrite(fake_file)
+        self.assertMultiLineEqual(fake_file.getvalue(), ORIGINAL_CMAKE_FILE)
+
     def test_rewrite_file_simple_tag(self):
         cmake_file = CMakeFile('# File header\necbuild_bundle( PROJECT oops     GIT "https://github.com/jcsda-internal/oops.git"       BRANCH develop UPDATE )\n')
         expected = '# File header\necbuild_bundle( PROJECT oops GIT "https://github.com/jcsda-internal/oops.git" TAG abc123 )\n'
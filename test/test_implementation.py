@@ -0,0 +1,319 @@
+import concurrent.futures
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from ci_action import implementation
+from ci_action.library import pr_resolve
+
+
+def _which_all(executable):
+    return f'/usr/bin/{executable}'
+
+
+class TestGetBundleCompressor(unittest.TestCase):
+
+    def setUp(self):
+        implementation.get_bundle_compressor.cache_clear()
+
+    def tearDown(self):
+        implementation.get_bundle_compressor.cache_clear()
+
+    def test_gzip_is_the_default(self):
+        with mock.patch.object(implementation.shutil, 'which', side_effect=_which_all):
+            got = implementation.get_bundle_compressor()
+        self.assertEqual(got, ('pigz -3', '.tar.gz'))
+
+    def test_zstd_when_enabled(self):
+        with mock.patch.object(implementation.shutil, 'which', side_effect=_which_all), \
+                mock.patch.object(implementation, 'BUNDLE_COMPRESSION', 'zstd'):
+            got = implementation.get_bundle_compressor()
+        self.assertEqual(got, ('zstd -T0 -3', '.tar.zst'))
+
+    def test_gzip_fallback(self):
+        def which(executable):
+            return '/bin/gzip' if executable == 'gzip' else None
+        with mock.patch.object(implementation.shutil, 'which', side_effect=which):
+            got = implementation.get_bundle_compressor()
+        self.assertEqual(got, ('gzip -3', '.tar.gz'))
+
+
+class FakeS3Client:
+    """An S3 client that keeps uploaded objects in memory."""
+
+    def __init__(self):
+        self.objects = {}
+
+    def upload_fileobj(self, fileobj, bucket, key, Config=None):
+        self.objects[key] = fileobj.read()
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop(Key, None)
+
+    def head_object(self, Bucket, Key):
+        import botocore.exceptions
+        if Key not in self.objects:
+            raise botocore.exceptions.ClientError({'Error': {'Code': '404'}}, 'HeadObject')
+        return {}
+
+
+class TestUploadTarballToAws(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.work_dir)
+        implementation.get_bundle_compressor.cache_clear()
+        self.addCleanup(implementation.get_bundle_compressor.cache_clear)
+
+    def test_upload(self):
+        source_path = os.path.join(self.work_dir, 'bundle')
+        os.makedirs(source_path)
+        s3_client = FakeS3Client()
+        got = implementation.upload_tarball_to_aws('bucket', s3_client, source_path, 'key')
+        self.assertEqual(got, 's3://bucket/key')
+        self.assertIn('key', s3_client.objects)
+
+    def test_failed_tar_deletes_object(self):
+        # tar fails since the source does not exist, after the upload completed.
+        source_path = os.path.join(self.work_dir, 'missing')
+        s3_client = FakeS3Client()
+        with self.assertRaises(subprocess.CalledProcessError):
+            implementation.upload_tarball_to_aws('bucket', s3_client, source_path, 'key')
+        self.assertNotIn('key', s3_client.objects)
+
+
+class TestFetchBundleRepo(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.work_dir)
+        self.bundle_repo_path = os.path.join(self.work_dir, 'bundle')
+        patches = [
+            mock.patch.object(implementation, 'get_remote_branch_sha', return_value='abc'),
+            mock.patch.object(implementation, 's3_object_exists', return_value=True),
+            mock.patch.object(implementation, 'check_output', return_value=b'abc\n'),
+            mock.patch.object(implementation, 'get_bundle_clone_cache_key',
+                              side_effect=lambda repository, sha: f'cache/{sha}'),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def _fetch(self, cache_executor):
+        implementation.fetch_bundle_repo(
+            mock.Mock(), 'https://github.com/org/bundle.git', 'develop', self.bundle_repo_path,
+            cache_executor=cache_executor)
+
+    def test_cache_hit_is_downloaded(self):
+        cache_executor = mock.Mock()
+        with mock.patch.object(implementation, 'download_tarball_from_aws') as download, \
+                mock.patch.object(implementation, 'clone_bundle_repo') as clone:
+            self._fetch(cache_executor)
+        download.assert_called_once()
+        clone.assert_not_called()
+        cache_executor.submit.assert_not_called()
+
+    def test_failed_download_falls_back_to_clone(self):
+        def partial_download(bucket, s3_client, s3_file, destination_path):
+            os.makedirs(destination_path)
+            raise subprocess.CalledProcessError(2, ['tar'])
+
+        def clone(repository, branch, path):
+            # The partially extracted directory must be gone before cloning.
+            self.assertFalse(os.path.exists(path))
+            os.makedirs(path)
+
+        cache_executor = mock.Mock()
+        with mock.patch.object(implementation, 'download_tarball_from_aws',
+                               side_effect=partial_download), \
+                mock.patch.object(implementation, 'clone_bundle_repo',
+                                  side_effect=clone) as clone_mock:
+            self._fetch(cache_executor)
+        clone_mock.assert_called_once()
+        # The fresh clone replaces the bad cache entry.
+        submit_args = cache_executor.submit.call_args.args
+        self.assertEqual(submit_args[0], implementation.cache_bundle_clone)
+        self.assertEqual(submit_args[3], 'cache/abc')
+        shutil.rmtree(os.path.dirname(submit_args[2]))
+
+    def test_cache_upload_does_not_block_rewrite(self):
+        def clone(repository, branch, path):
+            os.makedirs(path)
+            with open(os.path.join(path, 'CMakeLists.txt'), 'w') as f:
+                f.write('project(bundle)')
+
+        upload_started = threading.Event()
+        release_upload = threading.Event()
+        uploaded = {}
+
+        def upload(bucket, s3_client, source_path, s3_file):
+            upload_started.set()
+            release_upload.wait(10)
+            with open(os.path.join(source_path, 'CMakeLists.txt')) as f:
+                uploaded[s3_file] = f.read()
+
+        implementation.s3_object_exists.return_value = False
+        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as cache_executor, \
+                mock.patch.object(implementation, 'clone_bundle_repo', side_effect=clone), \
+                mock.patch.object(implementation, 'upload_tarball_to_aws', side_effect=upload):
+            self._fetch(cache_executor)
+            # The clone is returned and rewritten while the cache upload is blocked.
+            self.assertTrue(upload_started.wait(10))
+            with open(os.path.join(self.bundle_repo_path, 'CMakeLists.txt'), 'w') as f:
+                f.write('project(rewritten)')
+            release_upload.set()
+        # The cache holds the clean clone, not the rewritten bundle.
+        self.assertDictEqual(uploaded, {'cache/abc': 'project(bundle)'})
+
+
+class TestBundleContentDigest(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.work_dir)
+        self.bundle_repo_path = os.path.join(self.work_dir, 'bundle')
+        self.resources_path = os.path.join(self.work_dir, 'shell')
+        os.makedirs(self.resources_path)
+        self._write(os.path.join(self.resources_path, 'run_tests.sh'), 'echo test')
+        self.bundle_file = os.path.join(self.bundle_repo_path, 'CMakeLists.txt')
+        git = ['git', '-C', self.bundle_repo_path, '-c', 'user.name=ci', '-c', 'user.email=ci@ci']
+        subprocess.run(['git', 'init', '-q', self.bundle_repo_path], check=True)
+        self._write(self.bundle_file, 'project(bundle)')
+        subprocess.run(git + ['add', '.'], check=True)
+        subprocess.run(git + ['commit', '-q', '-m', 'init'], check=True)
+        self.commit = git + ['commit', '-q', '--allow-empty', '-m', 'next']
+
+    @staticmethod
+    def _write(path, content):
+        with open(path, 'w') as f:
+            f.write(content)
+
+    def _digest(self):
+        return implementation.get_bundle_content_digest(
+            self.bundle_repo_path, [self.bundle_file], [self.resources_path])
+
+    def test_digest_is_stable(self):
+        self.assertEqual(self._digest(), self._digest())
+
+    def test_digest_covers_inputs(self):
+        digest = self._digest()
+        self._write(self.bundle_file, 'project(rewritten)')
+        rewritten_digest = self._digest()
+        self._write(os.path.join(self.resources_path, 'run_tests.sh'), 'echo changed')
+        resources_digest = self._digest()
+        subprocess.run(self.commit, check=True)
+        commit_digest = self._digest()
+        self.assertEqual(
+            len({digest, rewritten_digest, resources_digest, commit_digest}), 4)
+
+    def test_digest_covers_mode(self):
+        script = os.path.join(self.resources_path, 'run_tests.sh')
+        os.chmod(script, 0o644)
+        digest = self._digest()
+        os.chmod(script, 0o755)
+        self.assertNotEqual(self._digest(), digest)
+
+    def test_digest_covers_names_and_links(self):
+        digest = self._digest()
+        os.rename(os.path.join(self.resources_path, 'run_tests.sh'),
+                  os.path.join(self.resources_path, 'run_test.sh'))
+        renamed_digest = self._digest()
+        link = os.path.join(self.resources_path, 'latest')
+        os.symlink('run_test.sh', link)
+        link_digest = self._digest()
+        os.remove(link)
+        os.symlink('missing.sh', link)
+        retargeted_digest = self._digest()
+        self.assertEqual(
+            len({digest, renamed_digest, link_digest, retargeted_digest}), 4)
+
+
+class TestUploadOrReuseBundleTarball(unittest.TestCase):
+
+    def test_existing_tarball_is_reused(self):
+        s3_client = FakeS3Client()
+        s3_client.objects['bundle.tar.gz'] = b'tarball'
+        with mock.patch.object(implementation, 'upload_tarball_to_aws') as upload:
+            got = implementation.upload_or_reuse_bundle_tarball(
+                s3_client, '/bundle', 'bundle.tar.gz')
+        upload.assert_not_called()
+        self.assertEqual(got, f's3://{implementation.BUILD_CACHE_BUCKET}/bundle.tar.gz')
+
+    def test_missing_tarball_is_uploaded(self):
+        s3_client = FakeS3Client()
+        with mock.patch.object(implementation, 'upload_tarball_to_aws',
+                               return_value='s3://bucket/bundle.tar.gz') as upload:
+            got = implementation.upload_or_reuse_bundle_tarball(
+                s3_client, '/bundle', 'bundle.tar.gz')
+        upload.assert_called_once()
+        self.assertEqual(got, 's3://bucket/bundle.tar.gz')
+
+
+class TestDraftPullRequest(unittest.TestCase):
+
+    def _run(self, run_on_draft):
+        annotations = pr_resolve.TestAnnotations(
+            build_group_map={}, skip_cache='false', rebuild_cache='false',
+            run_on_draft=run_on_draft, debug_mode=False, next_ci_suffix='', test_select='all',
+            jedi_bundle_branch='', jedi_ci_manifest_branch='')
+        config = {
+            'owner': 'JCSDA-internal', 'repo_name': 'oops', 'pull_request_number': 5,
+            'pr_payload': {'draft': True}, 'self_test': False,
+            'bundle_repository': 'https://github.com/JCSDA-internal/jedi-bundle.git',
+            'bundle_branch': 'develop',
+        }
+        with tempfile.TemporaryDirectory() as work_dir, \
+                mock.patch.object(implementation.aws_client, 'get_s3_client'), \
+                mock.patch.object(pr_resolve, 'read_test_annotations', return_value=annotations), \
+                mock.patch.object(implementation, 'fetch_bundle_repo',
+                                  side_effect=RuntimeError('stop')) as fetch, \
+                mock.patch.object(implementation.aws_client, 'cancel_prior_batch_jobs'), \
+                mock.patch.object(implementation.github_client,
+                                  'cancel_prior_unfinished_check_runs'), \
+                mock.patch.object(pr_resolve, 'gather_build_group_hashes', return_value={}):
+            try:
+                errors = implementation.prepare_and_launch_ci_test(
+                    infra_config={'batch_queue': 'arn:aws:batch:queue'}, config=config,
+                    bundle_repo_path=os.path.join(work_dir, 'bundle'), target_repo_path=work_dir)
+            except RuntimeError:
+                errors = None
+        return errors, fetch
+
+    def test_draft_is_not_cloned(self):
+        errors, fetch = self._run(run_on_draft=False)
+        self.assertEqual(errors, [])
+        fetch.assert_not_called()
+
+    def test_draft_with_annotation_is_cloned(self):
+        _, fetch = self._run(run_on_draft=True)
+        fetch.assert_called_once()
+
+
+class TestLaunchBuildEnvironments(unittest.TestCase):
+
+    def test_all_launched(self):
+        with mock.patch.object(implementation, 'launch_build_environment',
+                               return_value='arn') as launch:
+            implementation.launch_build_environments(['gcc', 'intel'], config={})
+        self.assertEqual(
+            sorted(c.kwargs['build_environment'] for c in launch.call_args_list), ['gcc', 'intel'])
+
+    def test_failure_is_raised_after_all_are_attempted(self):
+        def launch(build_environment, config):
+            if build_environment == 'intel':
+                raise ValueError('submit failed')
+            return 'arn'
+
+        with mock.patch.object(implementation, 'launch_build_environment',
+                               side_effect=launch) as launch_mock:
+            with self.assertRaisesRegex(RuntimeError, 'intel'):
+                implementation.launch_build_environments(['gcc', 'intel', 'gcc11'], config={})
+        self.assertEqual(launch_mock.call_count, 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,5 +1,36 @@
+import datetime
 import unittest
+from unittest import mock
 from ci_action.library.github_client import get_fullname_from_github_uri, get_repo_tuple_from_github_uri
+from ci_action.library import github_client
+from ci_action.library.github_client import GitHubAppClientManager, _parse_pr_check_runs
+
+
+def _check_run(run_id, name, status, started_at=None):
+    return {'databaseId': run_id, 'name': name, 'status': status, 'startedAt': started_at}
+
+
+def _check_suites(*suites, end_cursor=None):
+    """Build a page of check suites from lists of check runs."""
+    return {
+        'pageInfo': {'hasNextPage': end_cursor is not None, 'endCursor': end_cursor},
+        'nodes': [{'checkRuns': {'nodes': runs}} for runs in suites],
+    }
+
+
+def _pr_check_runs_response(*commits):
+    """Build a GraphQL response from (sha, [check runs]) given oldest->newest.
+
+    A commit may instead be given as (sha, check suites page).
+    """
+    return {'data': {'repository': {'pullRequest': {'commits': {'nodes': [
+        {'commit': {
+            'oid': sha,
+            'checkSuites': runs if isinstance(runs, dict) else _check_suites(runs),
+        }}
+        for sha, runs in commits
+    ]}}}}}
+
 
 class TestPrResolve(unittest.TestCase):
     def testget_fullname_from_github_uri_with_git_suffix(self):
@@ -30,5 +61,92 @@ class TestPrResolve(unittest.TestCase):
         self.assertEqual(repo, expected_repo)
         self.assertEqual(org, expected_org)
 
+
+class TestCancelPriorCheckRuns(unittest.TestCase):
+    def test_parse_pr_check_runs(self):
+        """Test that the GraphQL response is flattened newest->oldest with REST style values"""
+        data = _pr_check_runs_response(
+            ('old', [_check_run(1, 'JEDI unit test: gcc', 'COMPLETED', '2024-01-01T00:00:00Z')]),
+            ('new', [_check_run(2, 'JEDI unit test: gcc', 'QUEUED')]),
+        )
+        commits = _parse_pr_check_runs(data)
+        self.assertEqual([sha for sha, _ in commits], ['new', 'old'])
+        self.assertEqual(commits[0][1][0], {'id': 2, 'name': 'JEDI unit test: gcc',
+                                            'status': 'queued', 'started_at': None})
+        self.assertEqual(commits[1][1][0]['started_at'],
+                         datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc))
+
+    def test_cancel_prior_unfinished_check_runs(self):
+        """Test that one query is made and only unfinished JEDI runs are skipped"""
+        data = _pr_check_runs_response(
+            ('oldest', [_check_run(1, 'JEDI unit test: gcc', 'IN_PROGRESS')]),
+            ('older', [_check_run(2, 'JEDI unit test: gcc', 'IN_PROGRESS'),
+                       _check_run(3, 'JEDI integration test: gcc', 'COMPLETED'),
+                       _check_run(4, 'CodeQL', 'QUEUED')]),
+            ('trigger', [_check_run(5, 'JEDI unit test: gcc', 'QUEUED', '2020-01-01T00:00:00Z'),
+                         _check_run(6, 'JEDI unit test: intel', 'QUEUED')]),
+        )
+        manager = GitHubAppClientManager('token', app_id=321361)
+        manager.client = mock.MagicMock()
+        manager.client.requester.graphql_query.return_value = ({}, data)
+        with mock.patch('ci_action.library.github_client.get_client', return_value=manager):
+            manager.cancel_prior_unfinished_check_runs('oops', 'jcsda-internal', 5)
+
+        manager.client.requester.graphql_query.assert_called_once()
+        query_variables = manager.client.requester.graphql_query.call_args.args[1]
+        self.assertEqual(query_variables['suiteFilter'], {'appId': 321361})
+        patched_urls = [
+            c.args[1] for c in manager.client.requester.requestJsonAndCheck.call_args_list]
+        self.assertEqual(sorted(patched_urls), ['/repos/jcsda-internal/oops/check-runs/2',
+                                                '/repos/jcsda-internal/oops/check-runs/5'])
+
+    def test_check_suites_are_paged(self):
+        """Test that a JEDI suite after the first page of check suites is found"""
+        data = _pr_check_runs_response(
+            ('older', _check_suites(*([[_check_run(1, 'CodeQL', 'QUEUED')]] * 10),
+                                    end_cursor='cursor1')),
+            ('trigger', [_check_run(2, 'JEDI unit test: gcc', 'QUEUED')]),
+        )
+        second_page = {'data': {'repository': {'object': {'checkSuites': _check_suites(
+            [_check_run(3, 'JEDI unit test: gcc', 'IN_PROGRESS')])}}}}
+        manager = GitHubAppClientManager('token')
+        manager.client = mock.MagicMock()
+        manager.client.requester.graphql_query.side_effect = [({}, data), ({}, second_page)]
+        with mock.patch('ci_action.library.github_client.get_client', return_value=manager):
+            manager.cancel_prior_unfinished_check_runs('oops', 'jcsda-internal', 5)
+
+        page_variables = manager.client.requester.graphql_query.call_args_list[1].args[1]
+        self.assertEqual(page_variables['oid'], 'older')
+        self.assertEqual(page_variables['after'], 'cursor1')
+        self.assertIsNone(page_variables['suiteFilter'])
+        manager.client.requester.requestJsonAndCheck.assert_called_once_with(
+            'PATCH', '/repos/jcsda-internal/oops/check-runs/3', input=mock.ANY)
+
+
+class TestCreateCheckRuns(unittest.TestCase):
+    def test_create_check_runs_single_request(self):
+        """Test that both check runs are created with one GraphQL request"""
+        manager = GitHubAppClientManager('token')
+        manager.client = mock.MagicMock()
+        manager.client.get_repo.return_value.node_id = 'R_node'
+        manager.client.requester.graphql_query.return_value = ({}, {'data': {
+            'unit': {'checkRun': {'databaseId': 11}},
+            'integration': {'checkRun': {'databaseId': 12}},
+        }})
+        with mock.patch.object(github_client, 'get_client', return_value=manager), \
+                mock.patch.dict(github_client._repository_node_ids, clear=True):
+            run_ids = github_client.create_check_runs('gcc', 'oops', 'jcsda-internal', 'abc123', '')
+
+        self.assertEqual(run_ids, {'unit': 11, 'integration': 12})
+        manager.client.requester.graphql_query.assert_called_once()
+        query_variables = manager.client.requester.graphql_query.call_args.args[1]
+        self.assertEqual(query_variables, {
+            'repositoryId': 'R_node',
+            'headSha': 'abc123',
+            'unitName': 'JEDI unit test: gcc',
+            'integrationName': 'JEDI integration test: gcc',
+        })
+
+
 if __name__ == "__main__":
     unittest.main() 
\ No newline at end of file
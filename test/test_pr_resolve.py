@@ -0,0 +1,46 @@
+import unittest
+from unittest import mock
+
+from ci_action.library import pr_resolve
+
+PR_PAYLOAD = {
+    'number': 123,
+    'head': {'ref': 'feature/branch', 'sha': 'abcdef123456'},
+    'base': {'repo': {'clone_url': 'https://github.com/JCSDA-internal/oops.git'}},
+}
+
+
+class TestGatherBuildGroupHashes(unittest.TestCase):
+
+    def test_known_pr_payload_is_not_fetched(self):
+        with mock.patch.object(pr_resolve, 'get_pull_request_head') as get_head:
+            got = pr_resolve.gather_build_group_hashes(
+                {'jcsda-internal/oops': 123},
+                pr_payloads={'jcsda-internal/oops': PR_PAYLOAD})
+        get_head.assert_not_called()
+        self.assertDictEqual(got, {
+            'jcsda-internal/oops': {
+                'name_key': 'jcsda-internal/oops',
+                'uri': 'https://github.com/JCSDA-internal/oops.git',
+                'version_ref': {
+                    'pr_id': 123,
+                    'branch': 'feature/branch',
+                    'commit': 'abcdef123456',
+                },
+            },
+        })
+
+    def test_other_prs_are_fetched(self):
+        fetched_head = ('https://github.com/JCSDA-internal/ufo.git', 7, 'develop', 'fedcba')
+        with mock.patch.object(pr_resolve, 'get_pull_request_head',
+                               return_value=fetched_head) as get_head:
+            got = pr_resolve.gather_build_group_hashes(
+                {'jcsda-internal/oops': 123, 'jcsda-internal/ufo': 7},
+                pr_payloads={'jcsda-internal/oops': PR_PAYLOAD})
+        get_head.assert_called_once_with('jcsda-internal', 'ufo', 7)
+        self.assertEqual(got['jcsda-internal/ufo']['version_ref']['commit'], 'fedcba')
+        self.assertEqual(got['jcsda-internal/oops']['version_ref']['commit'], 'abcdef123456')
+
+
+if __name__ == '__main__':
+    unittest.main()